@@ -11,7 +11,9 @@ Produces a short report with findings.
 """
 
 import csv
+import os
 import re
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
 
@@ -25,124 +27,223 @@ from pathlib import Path
 # - Codes with a trailing "*" (asterisk codes in ICD10)
 # - Codes with a trailing "|" (dagger codes in ICD10)
 # - Codes with a trailing "~" (seen a lot in data before 2023)
-ICD10_PATTERN = re.compile(r"^[A-Z][0-9]{2}\.?[0-9X]?[0-9]?[*|~]?$")
+# The 4th/5th character group is written so that a single digit can only be
+# matched one way, which avoids backtracking on codes that don't match.
+ICD10_PATTERN = re.compile(r"^[A-Z][0-9]{2}\.?(?:[0-9X][0-9]?)?[*|~]?$")
 
 # Valid financial year patterns:
 # - canonical format required: "2024-25" (YYYY-YY)
 FY_PATTERN = re.compile(r"^\d{4}-\d{2}$")
 
+# Values that are always valid, after normalising
+BLANK_VALUES = frozenset({"", "NULL"})
 
-def is_valid(value, pattern):
-    """Check if value matches pattern (blank/NULL always valid)."""
-    v = (value or "").strip().upper()
-    return v == "" or v == "NULL" or pattern.match(v)
 
+def _is_blank_or_match(value, match) -> bool:
+    """Check if value matches via `match` (blank/NULL always valid)."""
+    if not value:
+        return True
+    v = value.strip().upper()
+    return v in BLANK_VALUES or match(v) is not None
 
-def validate_file(filepath):
-    """Validate a CSV file, returning stats."""
-    invalid_fy = set()
-    row_count = 0
 
-    try:
-        with open(filepath) as f:
-            for row in csv.DictReader(f):
-                row_count += 1
-                fy = row.get("financial_year", "")
+# ICD10 codes and financial years repeat across many rows, so remember the
+# result for each distinct raw value rather than re-running the regex. Once a
+# memo is full, new values are checked without being remembered, so dirty
+# extracts with many distinct values can't grow it without limit.
+MAX_ICD10_VALIDITY_REMEMBERED = 65536
+MAX_FY_VALUES_REMEMBERED = 1024
+_icd10_validity = {}
+_fy_validity = {}
 
-                if not is_valid(fy, FY_PATTERN):
-                    invalid_fy.add(fy.strip())
 
-        # Get file size in bytes
-        file_size_bytes = Path(filepath).stat().st_size
-    except FileNotFoundError:
-        file_size_bytes = 0
+def is_valid_icd10(value) -> bool:
+    """Check if value is a valid ICD10 code (blank/NULL always valid)."""
+    valid = _icd10_validity.get(value)
+    if valid is None:
+        valid = _is_blank_or_match(value, ICD10_PATTERN.match)
+        if len(_icd10_validity) < MAX_ICD10_VALIDITY_REMEMBERED:
+            _icd10_validity[value] = valid
+    return valid
 
-    return invalid_fy, row_count, file_size_bytes
 
+def is_valid_fy(value) -> bool:
+    """Check if value is a valid financial year (blank/NULL always valid)."""
+    valid = _fy_validity.get(value)
+    if valid is None:
+        valid = _is_blank_or_match(value, FY_PATTERN.match)
+        if len(_fy_validity) < MAX_FY_VALUES_REMEMBERED:
+            _fy_validity[value] = valid
+    return valid
 
-def format_bullet_list(items):
+
+def format_bullet_list(items, more_rows=0):
+    """Format items as a bullet list, noting `more_rows` rows that weren't listed."""
     if not items:
         return "None"
-    return "\n" + "\n".join(f"    - {item}" for item in sorted(items))
+    # Leading "" puts the first item on its own line
+    lines = ["", *(f"    - {item}" for item in sorted(items))]
+    if more_rows:
+        lines.append(f"    - ... and {more_rows:,} more rows")
+    return "\n".join(lines)
 
 
 def format_markdown_bullet_list(items):
     if not items:
         return "None"
-    return "\n" + "\n".join(f"- `{item}`" for item in sorted(items))
+    return "\n".join(["", *(f"- `{item}`" for item in sorted(items))])
 
 
-def write_partitioned_csv(header: list, outfile_base: str, rows: list):
-    """Write `rows` (list of dict) to CSV(s) with header.
+# Stop recording distinct invalid financial years after this many, and just
+# count the remaining rows, so pathological inputs can't grow the set unbounded
+MAX_INVALID_FY_REPORTED = 1000
+
+# Use large buffers for reading and writing CSVs to reduce the number of syscalls
+IO_BUFFER_SIZE = 1 << 20
+
+# Threshold behaviour for output files
+MAX_TOTAL_ROWS = 5000
+MAX_TOTAL_ROWS_SAFE = MAX_TOTAL_ROWS - 10  # leave some margin
+
+
+class PlainCsvWriter:
+    """A csv.writer for rows whose fields don't normally need quoting.
+
+    The per-FY outputs only hold ICD10 codes and counts, so rows are joined
+    with commas and written directly, skipping csv.writer's per-field checks.
+    Any row that would need quoting is passed to a real csv.writer, so the
+    output matches csv.writer's exactly.
+    """
+
+    def __init__(self, f):
+        self.write = f.write
+        self.csv_writer = csv.writer(f)
+
+    def writerow(self, row: list):
+        line = ",".join(row)
+        if (
+            not line
+            or line.count(",") >= len(row)
+            or '"' in line
+            or "\n" in line
+            or "\r" in line
+        ):
+            self.csv_writer.writerow(row)
+        else:
+            # csv.writer's default line terminator
+            self.write(line + "\r\n")
+
+    def writerows(self, rows):
+        for row in rows:
+            self.writerow(row)
+
+
+class PartitionedCsvWriter:
+    """Stream rows (lists, in header order) to CSV(s) with header.
 
     outfile_base is a string representing the desired filename
     for a single file. If the total row count including header would be >= 5000
     then the output will be partitioned into files of at most 4,990 rows
     (including header) to stay safely under the 5,000-row threshold.
 
-    Returns a list of tuples: [(filepath, data_rows_written), ...].
+    Rows are written as they arrive. Once the single file holds 4,990 rows, the
+    next few rows are held back until we know whether the output fits in one
+    file (they are appended on close) or must be partitioned (the single file
+    becomes the first partition and they start the second). A partition's
+    final name includes its end row, so it is renamed when it is closed.
+
+    If plain is True, rows are written with PlainCsvWriter rather than
+    csv.writer. Rows must then be lists of strings.
     """
-    # Threshold behaviour
-    MAX_TOTAL_ROWS = 5000
-    MAX_TOTAL_ROWS_SAFE = MAX_TOTAL_ROWS - 10  # leave some margin
 
-    total_rows_including_header = len(rows) + 1
-    if total_rows_including_header < MAX_TOTAL_ROWS:
+    def __init__(self, header: list, outfile_base: str, plain: bool = False):
+        self.header = header
+        self.outfile_base = outfile_base
+        self.writer_class = PlainCsvWriter if plain else csv.writer
+        self.single_path = Path("output") / f"{outfile_base}.csv"
+        self.path = None
+        self.file = None
+        self.writer = None
+        self.rows_in_file = 0
+        self.held_back = []
+        self.partitioned = False
+        self.current_start = 1  # original-file row number for header is 1
+        self.created = []
+
+    def writerow(self, row: list):
+        if self.partitioned:
+            if self.rows_in_file == MAX_TOTAL_ROWS_SAFE:
+                self._close_partition()
+                self._open_partition()
+        elif self.rows_in_file == MAX_TOTAL_ROWS_SAFE:
+            self.held_back.append(row)
+            if self.rows_in_file + len(self.held_back) + 1 < MAX_TOTAL_ROWS:
+                return
+            # Too many rows for a single file, so it becomes the first partition
+            self.partitioned = True
+            self._close_partition()
+            self._open_partition()
+            self.writer.writerows(self.held_back)
+            self.rows_in_file = len(self.held_back)
+            self.held_back = []
+            return
+        elif self.file is None:
+            self._open(self.single_path)
+
+        self.writer.writerow(row)
+        self.rows_in_file += 1
+
+    def close(self):
+        """Finish writing and return [(filepath, data_rows_written), ...]."""
+        if self.partitioned:
+            self._close_partition()
+            return self.created
+
         # single file
-        out_file = Path("output") / f"{outfile_base}.csv"
-        with open(out_file, "w", newline="") as wf:
-            writer = csv.DictWriter(wf, fieldnames=header)
-            writer.writeheader()
-            for row in rows:
-                writer.writerow(row)
-        return [(str(out_file), len(rows))]
-
-    # Partition into chunks of MAX_TOTAL_ROWS_SAFErows
-    created = []
-    current_start = 1  # original-file row number for header is 1
-    for i in range(0, len(rows), MAX_TOTAL_ROWS_SAFE):
-        chunk = rows[i : i + MAX_TOTAL_ROWS_SAFE]
-        chunk_len = len(chunk)
-        chunk_start = current_start
-        chunk_end = current_start + chunk_len
+        if self.file is None:
+            self._open(self.single_path)
+        self.writer.writerows(self.held_back)
+        self.rows_in_file += len(self.held_back)
+        self.held_back = []
+        self.file.close()
+        self.created.append((str(self.single_path), self.rows_in_file))
+        return self.created
+
+    def _open(self, path):
+        self.path = path
+        self.file = open(path, "w", newline="", buffering=IO_BUFFER_SIZE)
+        self.writer = self.writer_class(self.file)
+        self.writer.writerow(self.header)
+        self.rows_in_file = 0
+
+    def _open_partition(self):
+        # The end row isn't known yet, so write under a temporary name
+        self._open(
+            Path("output") / f"{self.outfile_base}_rows_{self.current_start:04d}.tmp"
+        )
+
+    def _close_partition(self):
+        self.file.close()
+        chunk_start = self.current_start
+        chunk_end = self.current_start + self.rows_in_file
         suffix = f"_rows_{chunk_start:04d}_{chunk_end:04d}"
-        partition_path = Path("output") / f"{outfile_base}{suffix}.csv"
-        with open(partition_path, "w", newline="") as wf:
-            writer = csv.DictWriter(wf, fieldnames=header)
-            writer.writeheader()
-            for row in chunk:
-                writer.writerow(row)
-        created.append((str(partition_path), chunk_len))
-        current_start = chunk_end + 1
+        partition_path = Path("output") / f"{self.outfile_base}{suffix}.csv"
+        self.path.replace(partition_path)
+        self.created.append((str(partition_path), self.rows_in_file))
+        self.current_start = chunk_end + 1
 
-    return created
 
+def write_partitioned_csv(header: list, outfile_base: str, rows: list):
+    """Write `rows` (list of lists, in header order) to CSV(s) with header.
 
-def write_invalid_icd10_rows(input_path: str, source: str):
-    """Write rows with invalid ICD10 codes from input CSV to a new CSV.
+    See PartitionedCsvWriter for how the output is partitioned.
 
-    Keeps the original columns (including financial_year).
-    Returns filepath and number of rows written.
+    Returns a list of tuples: [(filepath, data_rows_written), ...].
     """
-    p = Path(input_path)
-    if not p.exists():
-        return []
-
-    with open(p) as f:
-        reader = csv.DictReader(f)
-        header = reader.fieldnames or []
-        rows = [
-            row
-            for row in reader
-            if not is_valid(row.get("icd10_code", ""), ICD10_PATTERN)
-        ]
-
-    if not rows:
-        return []
-
-    # Use partitioned writer
-    created = write_partitioned_csv(header, f"icd10_{source}_invalid_rows", rows)
-    return created
+    writer = PartitionedCsvWriter(header, outfile_base)
+    for row in rows:
+        writer.writerow(row)
+    return writer.close()
 
 
 def format_size(bytes_count: int) -> str:
@@ -162,90 +263,171 @@ def normalize_fy(raw_fy: str):
     return s if FY_PATTERN.match(s) else None
 
 
+# Financial years repeat across many rows, so remember the slug for each
+# distinct raw value (up to MAX_FY_VALUES_REMEMBERED) rather than re-running
+# the regex.
+_fy_slugs = {}
+_FY_SEPARATOR_TABLE = str.maketrans("-", "_")
+
+
 def slugify_fy(raw_fy: str) -> str:
     """Return safe slug for FY for file naming, e.g. '2024-25' -> '2024_25'.
 
     If raw_fy is None or can't normalize, return 'unknown'.
     """
-    normalized = normalize_fy(raw_fy)
-    if not normalized:
-        return "unknown"
-    # Replace separator with underscore
-    return normalized.replace("-", "_")
-
+    slug = _fy_slugs.get(raw_fy)
+    if slug is None:
+        normalized = normalize_fy(raw_fy)
+        # Replace separator with underscore
+        slug = normalized.translate(_FY_SEPARATOR_TABLE) if normalized else "unknown"
+        if len(_fy_slugs) < MAX_FY_VALUES_REMEMBERED:
+            _fy_slugs[raw_fy] = slug
+    return slug
+
+
+def process_source(input_path: str, source: str):
+    """Validate a CSV file and split it by financial year in a single pass.
+
+    Rows with a valid ICD10 code are written to one CSV per financial year
+    (dropping the financial_year column, except for unknown years). Rows with
+    an invalid ICD10 code are written to a separate CSV with all columns.
+
+    Returns a tuple of (invalid_fy, other_invalid_fy_rows, row_count,
+    file_size_bytes, fy_files, invalid_files) where invalid_fy holds at most
+    MAX_INVALID_FY_REPORTED distinct values, other_invalid_fy_rows counts rows
+    with an invalid financial year not in invalid_fy, and the file lists are
+    [(filepath, rows), ...].
+    """
+    invalid_fy = set()
+    other_invalid_fy_rows = 0
+    row_count = 0
+    writers_by_slug = {}
+    invalid_writer = None
 
-def split_by_financial_year(input_path: str, source: str):
-    """Split a CSV file by financial year and return created file info
+    # Get file size in bytes, which also tells us whether the file exists
+    try:
+        file_size_bytes = os.stat(input_path).st_size
+    except FileNotFoundError:
+        return invalid_fy, other_invalid_fy_rows, row_count, 0, [], []
+
+    with open(input_path, newline="", buffering=IO_BUFFER_SIZE) as f:
+        reader = csv.reader(f)
+        header = next(reader, [])
+        if not header:
+            # An empty file has no rows to validate or split
+            return (
+                invalid_fy,
+                other_invalid_fy_rows,
+                row_count,
+                file_size_bytes,
+                [],
+                [],
+            )
+        # Check the columns once up front, so the loop can index rows directly
+        missing = [c for c in ("financial_year", "icd10_code") if c not in header]
+        if missing:
+            raise ValueError(f"{input_path} is missing columns: {', '.join(missing)}")
+        fy_index = header.index("financial_year")
+        code_index = header.index("icd10_code")
+        # Header for the per-FY files, which drop 'financial_year'
+        fy_header = header[:fy_index] + header[fy_index + 1 :]
+        header_length = len(header)
 
-    Returns created_files: list[(outfile, rows)]
-    """
-    created = []
-    p = Path(input_path)
-    if not p.exists():
-        return created
-
-    with open(p) as f:
-        reader = csv.DictReader(f)
-        rows_by_slug = {}
-        slug_to_raws = {}
-        header = reader.fieldnames or []
         for row in reader:
-            raw_fy = row.get("financial_year", "")
-            code = (row.get("icd10_code", "") or "").strip()
-            slug = slugify_fy(raw_fy)
+            if not row:
+                continue
+            row_count += 1
+            if len(row) < header_length:
+                # Treat missing fields as blank, as csv.DictReader does, so
+                # every row written has a field for each column
+                row += [""] * (header_length - len(row))
+            raw_fy = row[fy_index]
+            code = row[code_index]
+
+            if not is_valid_fy(raw_fy):
+                fy = raw_fy.strip()
+                # Most invalid rows repeat a value we've already seen
+                if fy not in invalid_fy:
+                    if len(invalid_fy) < MAX_INVALID_FY_REPORTED:
+                        invalid_fy.add(fy)
+                    else:
+                        other_invalid_fy_rows += 1
+
             # Only include rows with valid ICD10 in per-FY splits. Invalid rows
-            # are collected separately by write_invalid_icd10_rows().
-            if is_valid(code, ICD10_PATTERN):
-                rows_by_slug.setdefault(slug, []).append(row)
-            slug_to_raws.setdefault(slug, set()).add((raw_fy or "").strip())
-
-    # Write out one CSV file per slug, removing 'financial_year' column
-    for slug, rows in rows_by_slug.items():
-        if slug == "unknown":
-            outfile_base = f"icd10_{source}_unknown_financial_year"
-        else:
-            outfile_base = f"icd10_{source}_{slug}"
-        # derive header; keep 'financial_year' for the unknown slug
-        if slug == "unknown":
-            out_header = list(header)
-        else:
-            out_header = [c for c in header if c != "financial_year"]
-        # If header is empty (some broken files), fall back to keys of first row
-        if not out_header and rows:
-            out_header = [k for k in rows[0].keys() if k != "financial_year"]
+            # are collected separately, keeping all their columns.
+            if not is_valid_icd10(code):
+                if invalid_writer is None:
+                    invalid_writer = PartitionedCsvWriter(
+                        header, f"icd10_{source}_invalid_rows"
+                    )
+                invalid_writer.writerow(row)
+                continue
+
+            slug = slugify_fy(raw_fy)
+            writer = writers_by_slug.get(slug)
+            if writer is None:
+                # Open a writer for this slug on its first row
+                if slug == "unknown":
+                    # keep 'financial_year' for the unknown slug
+                    writer = PartitionedCsvWriter(
+                        list(header), f"icd10_{source}_unknown_financial_year"
+                    )
+                else:
+                    # Rows here have a valid code and count columns from our
+                    # own queries, so can take the faster plain writer
+                    writer = PartitionedCsvWriter(
+                        fy_header, f"icd10_{source}_{slug}", plain=True
+                    )
+                writers_by_slug[slug] = writer
 
-        # Build output rows according to whether we keep financial_year
-        out_rows = []
-        for row in rows:
             if slug == "unknown":
-                raw_fy = (row.get("financial_year") or "").strip()
-                out_row = dict(row)
-                out_row["financial_year"] = raw_fy
+                # csv.reader yields a new list per row, so update it in place
+                row[fy_index] = raw_fy.strip()
+                writer.writerow(row)
             else:
-                out_row = {k: v for k, v in row.items() if k != "financial_year"}
-            out_rows.append(out_row)
-
-        # Write files (partitioned if necessary)
-        created_files = write_partitioned_csv(out_header, outfile_base, out_rows)
-        for fpath, rows_written in created_files:
-            created.append((fpath, rows_written))
-
-    return created
+                writer.writerow(row[:fy_index] + row[fy_index + 1 :])
+
+    # Finish the file(s) for each slug
+    fy_files = []
+    for writer in writers_by_slug.values():
+        fy_files.extend(writer.close())
+
+    invalid_files = invalid_writer.close() if invalid_writer else []
+
+    return (
+        invalid_fy,
+        other_invalid_fy_rows,
+        row_count,
+        file_size_bytes,
+        fy_files,
+        invalid_files,
+    )
 
 
 def main():
-    apcs_fy, apcs_rows, apcs_size_bytes = validate_file("output/icd10_apcs.csv")
-    ons_fy, ons_rows, ons_size_bytes = validate_file("output/icd10_ons_deaths.csv")
-
-    # Split files per financial year and record created files/collisions
-    apcs_created = split_by_financial_year("output/icd10_apcs.csv", "apcs")
-    ons_created = split_by_financial_year("output/icd10_ons_deaths.csv", "ons_deaths")
-
-    # Write invalid rows files
-    invalid_apcs_files = write_invalid_icd10_rows("output/icd10_apcs.csv", "apcs")
-    invalid_ons_files = write_invalid_icd10_rows(
-        "output/icd10_ons_deaths.csv", "ons_deaths"
-    )
+    # Validate each file and write the per-FY and invalid rows files. The two
+    # sources are independent, so process them in parallel.
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        apcs_future = executor.submit(process_source, "output/icd10_apcs.csv", "apcs")
+        ons_future = executor.submit(
+            process_source, "output/icd10_ons_deaths.csv", "ons_deaths"
+        )
+    (
+        apcs_fy,
+        apcs_other_fy,
+        apcs_rows,
+        apcs_size_bytes,
+        apcs_created,
+        invalid_apcs_files,
+    ) = apcs_future.result()
+    (
+        ons_fy,
+        ons_other_fy,
+        ons_rows,
+        ons_size_bytes,
+        ons_created,
+        invalid_ons_files,
+    ) = ons_future.result()
 
     lines = [
         "=" * 60,
@@ -255,13 +437,13 @@ def main():
         "HES APCS:",
         f"  File size: {format_size(apcs_size_bytes)}",
         f"  Rows: {apcs_rows:,}",
-        f"  Invalid financial years: {format_bullet_list(apcs_fy)}",
+        f"  Invalid financial years: {format_bullet_list(apcs_fy, apcs_other_fy)}",
         f"  Files created: {format_bullet_list([f for f, _ in apcs_created + invalid_apcs_files])}",
         "",
         "ONS Deaths:",
         f"  File size: {format_size(ons_size_bytes)}",
         f"  Rows: {ons_rows:,}",
-        f"  Invalid financial years: {format_bullet_list(ons_fy)}",
+        f"  Invalid financial years: {format_bullet_list(ons_fy, ons_other_fy)}",
         f"  Files created: {format_bullet_list([f for f, _ in ons_created + invalid_ons_files])}",
         "",
     ]
@@ -11,12 +11,17 @@ Generates separate reports for APCS and ONS deaths data.
 """
 
 import csv
+import heapq
 import sys
+from bisect import bisect_left, bisect_right
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain
+from operator import itemgetter
 
 from .common import (
-    CACHE_DIR,
-    find_code_column,
+    download_missing_codelists,
+    find_rsi_metadata,
     get_output_file,
     load_all_icd10_codelists_from_rsi,
     load_codelist,
@@ -27,17 +32,40 @@ from .common import (
 )
 
 
-def get_descendants(code, all_codes):
-    """Get all descendant codes of a given code from the set of all codes.
+def _descendant_range(code, sorted_codes):
+    """Find the slice of a sorted list of codes holding the descendants of code.
 
     ICD-10 is a prefix hierarchy: E1112 is a child of E111 is a child of E11.
+    Every code starting with `code` sorts between `code` itself and the first
+    string after all of its extensions, so the descendants are a contiguous
+    slice that we can find by bisection.
     """
-    descendants = set()
-    for candidate in all_codes:
-        # A code is a descendant if it starts with the parent code and is longer
-        if candidate != code and candidate.startswith(code):
-            descendants.add(candidate)
-    return descendants
+    if not code:
+        return 0, 0
+    # bisect_right skips the code itself
+    lo = bisect_right(sorted_codes, code)
+    # The smallest string greater than every string starting with code
+    successor = code[:-1] + chr(ord(code[-1]) + 1)
+    hi = bisect_left(sorted_codes, successor, lo)
+    return lo, hi
+
+
+def get_descendants(code, sorted_codes):
+    """Get all descendant codes of a given code from a sorted list of codes."""
+    lo, hi = _descendant_range(code, sorted_codes)
+    return sorted_codes[lo:hi]
+
+
+def count_descendants(code, sorted_codes):
+    """Count the descendant codes of a given code in a sorted list of codes."""
+    lo, hi = _descendant_range(code, sorted_codes)
+    return hi - lo
+
+
+def contains_code(sorted_codes, code):
+    """Check whether code is in a sorted list of codes."""
+    i = bisect_left(sorted_codes, code)
+    return i < len(sorted_codes) and sorted_codes[i] == code
 
 
 def classify_code_descendants(code, codelist_codes, hierarchy_ocl_codes):
@@ -50,8 +78,9 @@ def classify_code_descendants(code, codelist_codes, hierarchy_ocl_codes):
 
     Args:
         code: The code to classify
-        codelist_codes: Set of codes in the codelist
-        hierarchy_ocl_codes: Set of OCL codes to use for hierarchy
+        codelist_codes: Sorted list of the codelist's codes that are in the
+            hierarchy
+        hierarchy_ocl_codes: Sorted list of OCL codes to use for hierarchy
             Use the ONS deaths OCL codes here to get the true ICD-10 hierarchy,
             not the APCS codes which include synthetic X-suffixed codes.
 
@@ -62,72 +91,85 @@ def classify_code_descendants(code, codelist_codes, hierarchy_ocl_codes):
     if len(code) == 4:
         return "COMPLETE"
 
-    # Get all possible descendants from hierarchy OCL codes
-    ocl_descendants = get_descendants(code, hierarchy_ocl_codes)
+    # Count all possible descendants from hierarchy OCL codes
+    num_descendants = count_descendants(code, hierarchy_ocl_codes)
 
     # No descendants means COMPLETE (it's a leaf)
-    if not ocl_descendants:
+    if not num_descendants:
         return "COMPLETE"
 
-    # Check how many of the possible descendants are in the codelist
-    descendants_in_codelist = ocl_descendants & codelist_codes
-
-    if len(descendants_in_codelist) == len(ocl_descendants):
+    # Every codelist code in the hierarchy is one of the possible descendants,
+    # so comparing the counts tells us whether some or all of them are there
+    num_in_codelist = count_descendants(code, codelist_codes)
+    if num_in_codelist == num_descendants:
         return "COMPLETE"
-    elif len(descendants_in_codelist) == 0:
-        return "NONE"
-    else:
-        return "PARTIAL"
+    return "PARTIAL" if num_in_codelist else "NONE"
 
 
 def analyze_codelist(
     codelist_id,
     codelist_codes,
-    ocl_codes,
-    usage_codes,
+    non_ocl_usage_codes,
     usage_data,
     creation_method,
     hierarchy_ocl_codes,
     from_ehrql=False,
+    code_statuses=None,
 ):
-    """Analyze a single codelist for coverage."""
+    """Analyze a single codelist for coverage.
 
-    # Classify each code in the codelist as COMPLETE/PARTIAL/NONE
-    code_classifications = {}
-    for code in codelist_codes:
-        if code in hierarchy_ocl_codes:
-            classification = classify_code_descendants(
-                code, codelist_codes, hierarchy_ocl_codes
-            )
-            code_classifications[code] = classification
+    non_ocl_usage_codes (the codes with usage that aren't OCL codes for the
+    data source) and hierarchy_ocl_codes are sorted lists of codes, so that
+    descendants can be found with get_descendants.
 
-    # Calculate actual usage of codes in the codelist
+    Classifications only depend on the codes and the hierarchy, not the data
+    source, so code_statuses from an earlier analysis of the same codes can be
+    passed in to skip classifying them again.
+    """
+    # The codes are kept in the result, so make sure they can't change
+    codelist_codes = frozenset(codelist_codes)
+
+    # Classify each code in the codelist as COMPLETE/PARTIAL/NONE. Every code
+    # gets a status for the CSV report, but only codes in the hierarchy count
+    # as classified (and so can have EXTRA descendants).
+    hierarchy_codes = sorted(
+        code for code in codelist_codes if contains_code(hierarchy_ocl_codes, code)
+    )
+    if code_statuses is None:
+        code_statuses = {
+            code: classify_code_descendants(code, hierarchy_codes, hierarchy_ocl_codes)
+            for code in codelist_codes
+        }
+    code_classifications = {code: code_statuses[code] for code in hierarchy_codes}
+
+    # Calculate actual usage of codes in the codelist. Use .get() so that
+    # codes without usage are a single lookup (and aren't added to usage_data)
     actual_usage = defaultdict(int)
     for code in codelist_codes:
-        if code in usage_data:
-            for key, count in usage_data[code].items():
+        code_usage = usage_data.get(code)
+        if code_usage:
+            for key, count in code_usage.items():
                 actual_usage[key] += count
 
-    # Find missing descendants in usage data
-    missing_descendants = set()
-    for code in codelist_codes:
-        # Get all descendants from OCL
-        ocl_descendants = get_descendants(code, ocl_codes)
-        # Get all descendants from usage data
-        usage_descendants = set()
-        for usage_code in usage_codes:
-            if usage_code != code and usage_code.startswith(code):
-                usage_descendants.add(usage_code)
-
-        # Missing = in usage but not in OCL
-        missing = usage_descendants - ocl_descendants
-        missing_descendants.update(missing)
+    # Find missing descendants in usage data. The descendants of a code
+    # include the descendants of its own descendants, so going through the
+    # codes in order and skipping any under the last code looked up gives
+    # disjoint slices, already sorted.
+    missing_descendants = []
+    last_code = None
+    for code in sorted(codelist_codes):
+        if last_code is not None and code.startswith(last_code):
+            continue
+        last_code = code
+        # Missing = descendants in usage data but not in OCL
+        missing_descendants.extend(get_descendants(code, non_ocl_usage_codes))
 
     # Calculate potential additional usage from missing descendants
     potential_usage = defaultdict(int)
     for code in missing_descendants:
-        if code in usage_data:
-            for key, count in usage_data[code].items():
+        code_usage = usage_data.get(code)
+        if code_usage:
+            for key, count in code_usage.items():
                 potential_usage[key] += count
 
     return {
@@ -137,8 +179,9 @@ def analyze_codelist(
         "total_codes": len(codelist_codes),
         "codelist_codes": codelist_codes,  # Store the actual codes for CSV output
         "code_classifications": code_classifications,
+        "code_statuses": code_statuses,
         "actual_usage": dict(actual_usage),
-        "missing_descendants": sorted(missing_descendants),
+        "missing_descendants": missing_descendants,
         "potential_usage": dict(potential_usage),
     }
 
@@ -148,41 +191,68 @@ def format_number(n):
     return f"{n:,}"
 
 
+# Codes with these statuses have their usage descendants in the CSV report as
+# EXTRA rows. For uploaded codelists, descendants of NONE codes are included too.
+EXTRA_PARENT_STATUSES = frozenset({"COMPLETE", "PARTIAL"})
+UPLOADED_EXTRA_PARENT_STATUSES = EXTRA_PARENT_STATUSES | {"NONE"}
+
+
+def get_usage_columns(usage_data, data_source):
+    """Get the sorted 2024-25 category columns in usage data for a data source."""
+    # Filter columns based on data source
+    prefix = "apcs_" if data_source == "apcs" else "ons_"
+    # Collect all unique category columns with 2024-25 data
+    return sorted(
+        {
+            category
+            for code_usage in usage_data.values()
+            for category, year in code_usage
+            if year == "2024-25" and category.startswith(prefix)
+        }
+    )
+
+
 def write_csv_report(
     results,
     usage_data,
     raw_usage,
     output_file,
     data_source,
-    hierarchy_ocl_codes,
+    usage_columns=None,
+    usage_codes=None,
 ):
     """Write detailed CSV report with code-level breakdown using raw values.
 
+    results can be any iterable of results from analyze_codelist, already
+    sorted by report_order. Each result is written as soon as it's read, so
+    results can be streamed in as they're analyzed.
+
+    Code statuses come from the classifications made in analyze_codelist.
+
     Args:
         data_source: Either 'apcs' or 'ons_deaths' - used for filtering usage columns
-        hierarchy_ocl_codes: OCL codes to use for hierarchy classification
+        usage_columns: The columns from get_usage_columns, if already known
+        usage_codes: The codes in usage_data as a sorted list, if already known
     """
 
     # Get all 2024-25 category columns from usage data for this data source
-    usage_columns = []
-    if usage_data:
-        # Filter columns based on data source
-        prefix = "apcs_" if data_source == "apcs" else "ons_"
-        # Collect all unique category columns with 2024-25 data
-        for code in usage_data:
-            for category, year in usage_data[code].keys():
-                if (
-                    year == "2024-25"
-                    and category.startswith(prefix)
-                    and category not in usage_columns
-                ):
-                    usage_columns.append(category)
-    usage_columns = sorted(usage_columns)
-
-    # Sort results: EHRQL codelists first (from_ehrql=True), then others
-    results.sort(key=lambda r: (not r.get("from_ehrql", False), r["codelist_id"]))
-
-    with open(output_file, "w", newline="") as f:
+    if usage_columns is None:
+        usage_columns = get_usage_columns(usage_data, data_source)
+
+    # Sort the usage codes once, so each codelist can find the usage
+    # descendants of its codes with get_descendants
+    if usage_codes is None:
+        usage_codes = sorted(usage_data)
+
+    # Get the raw 2024-25 values for the usage columns once per code, rather
+    # than once per code per codelist
+    usage_values = {
+        code: tuple(values.get((col, "2024-25")) or "" for col in usage_columns)
+        for code, values in raw_usage.items()
+    }
+    no_usage_values = ("",) * len(usage_columns)
+
+    with open(output_file, "w", newline="", buffering=1 << 20) as f:
         fieldnames = [
             "codelist_id",
             "creation_method",
@@ -190,107 +260,183 @@ def write_csv_report(
             "icd10_code",
             "status",
         ] + usage_columns
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        writer.writeheader()
+        writer = csv.writer(f)
+        writer.writerow(fieldnames)
 
         for result in results:
             codelist_id = result["codelist_id"]
             creation_method = result.get("creation_method", "")
             from_ehrql_flag = "Y" if result.get("from_ehrql", False) else "N"
-            # Use codelist_codes from result if available, otherwise try to reload
-            if "codelist_codes" in result:
-                codelist_codes = result["codelist_codes"]
-            else:
-                codelist_codes = set()
-                # Reload codelist to get the actual codes
-                cache_filename = codelist_id.strip("/").replace("/", "_") + ".csv"
-                cache_path = CACHE_DIR / cache_filename
-                if cache_path.exists():
-                    with open(cache_path, encoding="utf-8") as cf:
-                        reader = csv.DictReader(cf)
-                        code_col = find_code_column(reader.fieldnames)
-                        if code_col:
-                            for row in reader:
-                                code = row.get(code_col, "").strip()
-                                if code:
-                                    codelist_codes.add(code)
-
-            # Collect all rows for this codelist before writing
-            rows_to_write = []
-            written_codes = set()
+            codelist_codes = result["codelist_codes"]
 
             # Get code classifications from result
             code_classifications = result.get("code_classifications", {})
+            code_statuses = result["code_statuses"]
+
+            # Collect EXTRA codes from usage data that are descendants of
+            # COMPLETE/PARTIAL codes, or NONE codes for uploaded codelists.
+            # Going through the parents in order, and skipping any parent
+            # that's a descendant of the last one included, means each slice
+            # of usage codes comes after the one before, so the EXTRA codes
+            # come out sorted without any duplicates.
+            include_statuses = (
+                UPLOADED_EXTRA_PARENT_STATUSES
+                if creation_method == "Uploaded"
+                else EXTRA_PARENT_STATUSES
+            )
+            include_parents = sorted(
+                code
+                for code, status in code_classifications.items()
+                if status in include_statuses
+            )
+            extra_codes = []
+            last_parent = None
+            for parent_code in include_parents:
+                if last_parent is not None and parent_code.startswith(last_parent):
+                    continue
+                last_parent = parent_code
+
+                extra_codes.extend(
+                    usage_code
+                    for usage_code in get_descendants(parent_code, usage_codes)
+                    if usage_code not in codelist_codes
+                )
+
+            # Merge the codelist codes with the EXTRA codes, so that rows are
+            # written in icd10_code order
+            writer.writerows(
+                (
+                    codelist_id,
+                    creation_method,
+                    from_ehrql_flag,
+                    code,
+                    code_statuses.get(code, "EXTRA"),
+                    # Raw 2024-25 usage values for this code
+                    *usage_values.get(code, no_usage_values),
+                )
+                for code in heapq.merge(sorted(codelist_codes), extra_codes)
+            )
+
+
+# Data shared by every codelist analyzed in a worker process, set by _init_worker
+_worker_data = {}
+
+# How many results each worker keeps for reuse by codelists with the same codes.
+# Versions of a codelist are next to each other in report order, so a few
+# recent results catch most of the reuse without keeping every result.
+MAX_CACHED_RESULTS = 32
 
-            # First pass: collect codes that are in the codelist
-            for code in codelist_codes:
-                # Get status from pre-computed classifications
-                status = code_classifications.get(code)
-                if status is None:
-                    # Fallback to calculating
-                    status = classify_code_descendants(
-                        code, codelist_codes, hierarchy_ocl_codes
-                    )
-
-                # Get usage data for this code for 2024-25 (using raw values)
-                row_data = {
-                    "codelist_id": codelist_id,
-                    "creation_method": creation_method,
-                    "Exists in ehrQL repo": from_ehrql_flag,
-                    "icd10_code": code,
-                    "status": status,
-                }
-                for col in usage_columns:
-                    raw_value = raw_usage.get(code, {}).get((col, "2024-25"), "")
-                    row_data[col] = raw_value if raw_value else ""
-
-                rows_to_write.append(row_data)
-                written_codes.add(code)
-
-            # Second pass: collect EXTRA codes from usage data that are descendants
-            # of COMPLETE/PARTIAL codes, or NONE codes for uploaded codelists
-            for usage_code in usage_data.keys():
-                if usage_code not in written_codes:
-                    # Check if this usage code is a descendant of any codelist code
-                    for parent_code, status in code_classifications.items():
-                        # Include descendants of COMPLETE and PARTIAL codes
-                        # For uploaded codelists, also include descendants of NONE codes
-                        should_include = status in ("COMPLETE", "PARTIAL") or (
-                            creation_method == "Uploaded" and status == "NONE"
-                        )
-
-                        if (
-                            should_include
-                            and usage_code.startswith(parent_code)
-                            and usage_code != parent_code
-                        ):
-                            # This is an extra descendant
-                            row_data = {
-                                "codelist_id": codelist_id,
-                                "creation_method": creation_method,
-                                "Exists in ehrQL repo": from_ehrql_flag,
-                                "icd10_code": usage_code,
-                                "status": "EXTRA",
-                            }
-                            for col in usage_columns:
-                                raw_value = raw_usage.get(usage_code, {}).get(
-                                    (col, "2024-25"), ""
-                                )
-                                row_data[col] = raw_value if raw_value else ""
-
-                            rows_to_write.append(row_data)
-                            written_codes.add(usage_code)
-                            break  # Don't add the same code multiple times
-
-            # Sort all rows by icd10_code and write them
-            for row_data in sorted(rows_to_write, key=lambda r: r["icd10_code"]):
-                writer.writerow(row_data)
+
+def _init_worker(
+    non_ocl_usage_codes,
+    usage_data,
+    hierarchy_ocl_codes,
+    rsi_map,
+    ehrql_set,
+    statuses_by_codes,
+):
+    _worker_data.update(
+        non_ocl_usage_codes=non_ocl_usage_codes,
+        usage_data=usage_data,
+        hierarchy_ocl_codes=hierarchy_ocl_codes,
+        rsi_map=rsi_map,
+        ehrql_set=ehrql_set,
+        statuses_by_codes=statuses_by_codes,
+        results_by_codes={},
+    )
+
+
+def _analyze_named_codelist(codelist_id):
+    """Load and analyze a named codelist, using the data from _init_worker.
+
+    Returns the analysis result, or None if the codelist couldn't be loaded.
+    """
+    codelist_codes = load_codelist(codelist_id)
+    if codelist_codes is None:
+        return None
+
+    # Get creation_method from metadata
+    metadata = find_rsi_metadata(codelist_id, _worker_data["rsi_map"])
+    creation_method = metadata["creation_method"] if metadata else None
+
+    from_ehrql = codelist_id in _worker_data["ehrql_set"]
+
+    # Many codelist versions have exactly the same codes, and everything but
+    # the codelist's metadata depends only on the codes, so reuse the analysis
+    # of recent codelists
+    results_by_codes = _worker_data["results_by_codes"]
+    codes_key = frozenset(codelist_codes)
+    previous = results_by_codes.get(codes_key)
+    if previous is not None:
+        return {
+            **previous,
+            "codelist_id": codelist_id,
+            "creation_method": creation_method,
+            "from_ehrql": from_ehrql,
+        }
+
+    result = analyze_codelist(
+        codelist_id,
+        codes_key,
+        _worker_data["non_ocl_usage_codes"],
+        _worker_data["usage_data"],
+        creation_method,
+        _worker_data["hierarchy_ocl_codes"],
+        from_ehrql,
+        _worker_data["statuses_by_codes"].get(codes_key),
+    )
+    if len(results_by_codes) >= MAX_CACHED_RESULTS:
+        # Drop the oldest result, as dicts keep insertion order
+        del results_by_codes[next(iter(results_by_codes))]
+    results_by_codes[codes_key] = result
+    return result
+
+
+def report_order(result):
+    """Sort key for results in the CSV report: ehrQL codelists first, then by ID."""
+    return (not result.get("from_ehrql", False), result["codelist_id"])
+
+
+def _report_progress(analyzed, done, total):
+    """Print progress for each (codelist_id, result) pair, and yield the results.
+
+    Codelists that couldn't be loaded have a result of None, and are skipped.
+    """
+    for i, (codelist_id, result) in enumerate(analyzed, done + 1):
+        print(f"[{i}/{total}] {codelist_id}", file=sys.stderr)
+        if result is not None:
+            yield result
+
+
+def _record_statuses(results, statuses_by_codes):
+    """Yield results, recording the code statuses for each set of codes."""
+    for result in results:
+        statuses_by_codes[result["codelist_codes"]] = result["code_statuses"]
+        yield result
 
 
 def analyze_data_source(
-    data_source, ocl_codes, icd10_codelists, inline_codelists, rsi_map, ehrql_set
+    data_source,
+    ocl_codes,
+    sorted_ocl_codes,
+    icd10_codelists,
+    inline_codelists,
+    rsi_map,
+    ehrql_set,
+    statuses_by_codes=None,
 ):
-    """Analyze coverage for a specific data source (APCS or ONS deaths)."""
+    """Analyze coverage for a specific data source (APCS or ONS deaths).
+
+    sorted_ocl_codes has the same keys as ocl_codes, with each set of codes
+    as a sorted list.
+
+    statuses_by_codes maps a frozenset of codelist codes to code statuses that
+    have already been worked out for them. Returns the same mapping for the
+    codelists analyzed here, so it can be passed to the next data source.
+    """
+    if statuses_by_codes is None:
+        statuses_by_codes = {}
+
     source_label = "APCS" if data_source == "apcs" else "ONS Deaths"
 
     print(f"\n{'=' * 80}", file=sys.stderr)
@@ -298,88 +444,94 @@ def analyze_data_source(
     print("=" * 80, file=sys.stderr)
 
     print(f"\nLoading {source_label} usage data...", file=sys.stderr)
-    usage_data, raw_usage = load_usage_data(data_source)
-    usage_codes = set(usage_data.keys())
+    # The CSV report only shows raw values for 2024-25
+    usage_data, raw_usage = load_usage_data(data_source, raw_usage_year="2024-25")
+    usage_codes = sorted(usage_data)
+    usage_columns = get_usage_columns(usage_data, data_source)
     print(f"  Loaded usage for {len(usage_codes)} codes", file=sys.stderr)
 
     # Get the OCL codes for this data source
     source_ocl_codes = ocl_codes[data_source]
     # Always use ONS deaths codes for hierarchy (true ICD-10 structure)
-    hierarchy_ocl_codes = ocl_codes["ons_deaths"]
+    hierarchy_ocl_codes = sorted_ocl_codes["ons_deaths"]
     print(
         f"  Using {len(source_ocl_codes)} OCL codes for {source_label}", file=sys.stderr
     )
+    # Whether a used code is in OCL doesn't depend on the codelist, so find the
+    # used codes that aren't once, and look for missing descendants among them
+    non_ocl_usage_codes = [code for code in usage_codes if code not in source_ocl_codes]
 
     print(f"\nAnalyzing codelists for {source_label}...", file=sys.stderr)
 
-    results = []
-
-    # Analyze named codelists
-    for i, codelist_id in enumerate(icd10_codelists, 1):
-        print(f"[{i}/{len(icd10_codelists)}] {codelist_id}", file=sys.stderr)
-
-        codelist_codes = load_codelist(codelist_id)
-        if codelist_codes is None:
-            continue
-
-        # Get creation_method from metadata
-        creation_method = None
-        if codelist_id in rsi_map:
-            creation_method = rsi_map[codelist_id]["creation_method"]
-        else:
-            # Try hash-only match
-            parts = codelist_id.strip("/").split("/")
-            if parts:
-                last_part = parts[-1]
-                if last_part in rsi_map:
-                    creation_method = rsi_map[last_part]["creation_method"]
+    # Fetch any uncached codelists up front, rather than one at a time as
+    # they're analyzed
+    download_missing_codelists(icd10_codelists)
 
-        from_ehrql = codelist_id in ehrql_set
+    total = len(icd10_codelists) + len(inline_codelists)
+    new_statuses_by_codes = {}
 
-        result = analyze_codelist(
-            codelist_id,
-            codelist_codes,
-            source_ocl_codes,
-            usage_codes,
-            usage_data,
-            creation_method,
-            hierarchy_ocl_codes,
-            from_ehrql,
-        )
-        results.append(result)
-
-    # Analyze inline codelists
-    for i, inline_cl in enumerate(inline_codelists, 1):
+    # Analyze inline codelists. There are only a few of these, so analyze them
+    # up front here and keep them until their turn in the report.
+    inline_results = []
+    for i, inline_cl in enumerate(sorted(inline_codelists, key=itemgetter("id")), 1):
         inline_id = inline_cl["id"]
         inline_codes = inline_cl["codes"]
-        print(
-            f"[{len(icd10_codelists) + i}/{len(icd10_codelists) + len(inline_codelists)}] {inline_id}",
-            file=sys.stderr,
-        )
+        print(f"[{i}/{total}] {inline_id}", file=sys.stderr)
 
         result = analyze_codelist(
             inline_id,
             inline_codes,
-            source_ocl_codes,
-            usage_codes,
+            non_ocl_usage_codes,
             usage_data,
             creation_method="Inline",
             hierarchy_ocl_codes=hierarchy_ocl_codes,
             from_ehrql=True,
+            code_statuses=statuses_by_codes.get(frozenset(inline_codes)),
         )
-        results.append(result)
-
-    # Write CSV report
-    csv_file = get_output_file(data_source)
-    print(f"Writing CSV detail to {csv_file}...", file=sys.stderr)
-    write_csv_report(
-        results,
-        usage_data,
-        raw_usage,
-        csv_file,
-        data_source,
-        hierarchy_ocl_codes,
+        inline_results.append(result)
+
+    # Analyze named codelists in report order. Each codelist is independent,
+    # so share the data with a pool of worker processes once and analyze them
+    # in parallel.
+    named_codelists = sorted(
+        icd10_codelists,
+        key=lambda codelist_id: (codelist_id not in ehrql_set, codelist_id),
     )
+    with ProcessPoolExecutor(
+        initializer=_init_worker,
+        initargs=(
+            non_ocl_usage_codes,
+            usage_data,
+            hierarchy_ocl_codes,
+            rsi_map,
+            ehrql_set,
+            statuses_by_codes,
+        ),
+    ) as executor:
+        analyzed = executor.map(_analyze_named_codelist, named_codelists, chunksize=16)
+        named_results = _report_progress(
+            zip(named_codelists, analyzed), len(inline_results), total
+        )
+
+        # Write CSV report. Each result is written as soon as it's ready, so
+        # only the code statuses are kept for the whole run, along with the
+        # few recent results each worker keeps for reuse (MAX_CACHED_RESULTS).
+        csv_file = get_output_file(data_source)
+        print(f"Writing CSV detail to {csv_file}...", file=sys.stderr)
+        write_csv_report(
+            _record_statuses(
+                heapq.merge(named_results, inline_results, key=report_order),
+                new_statuses_by_codes,
+            ),
+            usage_data,
+            raw_usage,
+            csv_file,
+            data_source,
+            usage_columns,
+            usage_codes,
+        )
+
+    return new_statuses_by_codes
 
 
 def main():
@@ -390,6 +542,8 @@ def main():
         file=sys.stderr,
     )
     print(f"  Generated {len(ocl_codes['apcs'])} codes for APCS", file=sys.stderr)
+    # Sort once, so descendants can be found by bisection rather than a scan
+    sorted_ocl_codes = {source: sorted(codes) for source, codes in ocl_codes.items()}
 
     # Load RSI metadata to get creation_method
     print("\nLoading codelist metadata...", file=sys.stderr)
@@ -412,31 +566,36 @@ def main():
     )
     all_icd10_versions = load_all_icd10_codelists_from_rsi()
 
-    # Combine: EHRQL codelists + all RSI versions (deduplicated)
-    combined_codelists = list(set(icd10_codelists + all_icd10_versions))
+    # Combine: EHRQL codelists + all RSI versions (deduplicated, keeping the
+    # order they were found in so that runs are reproducible)
+    combined_codelists = list(dict.fromkeys(chain(icd10_codelists, all_icd10_versions)))
     print(
         f"  Total unique ICD-10 codelist versions to analyze: {len(combined_codelists)}",
         file=sys.stderr,
     )
 
     # Analyze APCS
-    analyze_data_source(
+    statuses_by_codes = analyze_data_source(
         "apcs",
         ocl_codes,
+        sorted_ocl_codes,
         combined_codelists,
         inline_codelists,
         rsi_map,
         ehrql_set,
     )
 
-    # Analyze ONS Deaths
+    # Analyze ONS Deaths, reusing the code classifications from APCS as they
+    # don't depend on the data source
     analyze_data_source(
         "ons_deaths",
         ocl_codes,
+        sorted_ocl_codes,
         combined_codelists,
         inline_codelists,
         rsi_map,
         ehrql_set,
+        statuses_by_codes,
     )
 
 
@@ -18,6 +18,9 @@ Usage:
 """
 
 import csv
+import io
+from functools import lru_cache
+from operator import itemgetter
 
 from .common import (
     OUT_DIR,
@@ -31,12 +34,18 @@ from .common import (
 OUTPUT_CSV = OUT_DIR / "prefix_matching_analysis.csv"
 OUTPUT_MD = OUT_DIR / "prefix_matching_analysis.md"
 
+# Statuses of codes that are in a codelist, rather than EXTRA codes from usage
+CODELIST_STATUSES = frozenset({"COMPLETE", "PARTIAL", "NONE"})
+
 
 # ============================================================================
 # Stage 1: Analysis Functions
 # ============================================================================
 
 
+# Counts are parsed several times for each row, and the same values come up
+# again and again across rows, so cache them (bounded, as they come from input)
+@lru_cache(maxsize=65536)
 def parse_count(value):
     """Parse a count value, treating '<15' as 0."""
     if not value or value.startswith("<"):
@@ -49,25 +58,65 @@ def is_descendant(child, parent):
     return child.startswith(parent) and len(child) > len(parent)
 
 
+def get_ancestor_codes(code):
+    """Get every code that could be an ancestor of code, i.e. its proper prefixes.
+
+    A code has an ancestor in a set of codes if the set has any of these, which
+    is quicker to check than is_descendant(code, ancestor) for each ancestor.
+    """
+    return tuple(code[:i] for i in range(1, len(code)))
+
+
 def get_codelist_codes(data, codelist_id):
     """Get all rows for a specific codelist."""
     return [row for row in data if row["codelist_id"] == codelist_id]
 
 
-def analyze_primary_secondary(codelist_rows):
+def split_codelist(codelist_rows):
+    """
+    Split the rows for a codelist into codes in the codelist and EXTRA codes.
+
+    This is done once per codelist, and the result passed to each of the
+    analyze_* functions.
+
+    Returns dict with keys:
+    - codes: rows for codes in the codelist (COMPLETE, PARTIAL or NONE)
+    - extras: (row, ancestor codes) pairs for EXTRA codes, with the ancestor
+      codes from get_ancestor_codes, so that each analysis can use them
+    - complete, partial, none: sets of the codes with each status
+    """
+    codelist_codes = []
+    extra_codes = []
+    codes_by_status = {status: set() for status in CODELIST_STATUSES}
+    for r in codelist_rows:
+        status = r["status"]
+        if status == "EXTRA":
+            extra_codes.append((r, get_ancestor_codes(r["icd10_code"])))
+        elif status in CODELIST_STATUSES:
+            codelist_codes.append(r)
+            codes_by_status[status].add(r["icd10_code"])
+    return {
+        "codes": codelist_codes,
+        "extras": extra_codes,
+        "complete": codes_by_status["COMPLETE"],
+        "partial": codes_by_status["PARTIAL"],
+        "none": codes_by_status["NONE"],
+    }
+
+
+def analyze_primary_secondary(codelist):
     """
     Analyze primary and secondary counts under different scenarios.
 
+    codelist is the codelist's rows, as split by split_codelist.
+
     Returns dict with keys:
     - baseline_primary, baseline_secondary
     - strict_primary, strict_secondary
     - partial_primary, partial_secondary
     """
-    # Separate codes by status
-    codelist_codes = [
-        r for r in codelist_rows if r["status"] in ["COMPLETE", "PARTIAL", "NONE"]
-    ]
-    extra_codes = [r for r in codelist_rows if r["status"] == "EXTRA"]
+    codelist_codes = codelist["codes"]
+    extra_codes = codelist["extras"]
 
     # Baseline: only codelist codes
     baseline_primary = sum(parse_count(r["apcs_primary_count"]) for r in codelist_codes)
@@ -75,84 +124,52 @@ def analyze_primary_secondary(codelist_rows):
         parse_count(r["apcs_secondary_count"]) for r in codelist_codes
     )
 
-    # Build sets of codes by status
-    complete_codes = {
-        r["icd10_code"] for r in codelist_codes if r["status"] == "COMPLETE"
-    }
-    partial_codes = {
-        r["icd10_code"] for r in codelist_codes if r["status"] == "PARTIAL"
-    }
+    # Without EXTRA codes every scenario is the same as the baseline
+    if not extra_codes:
+        return {
+            "baseline_primary": baseline_primary,
+            "baseline_secondary": baseline_secondary,
+            "strict_primary": baseline_primary,
+            "strict_secondary": baseline_secondary,
+            "partial_primary": baseline_primary,
+            "partial_secondary": baseline_secondary,
+        }
+
+    # Sets of codes by status
+    complete_codes = codelist["complete"]
+    partial_codes = codelist["partial"]
 
     # Strict: Include EXTRA descendants of COMPLETE codes
     # - 4-char COMPLETE codes: include 5+ char EXTRA children
     # - 3-char COMPLETE codes: include 4-char EXTRA children + their 5+ char EXTRA children
+    complete_ancestors = {code for code in complete_codes if len(code) in (3, 4)}
+    # Partial: Include EXTRA descendants of COMPLETE and PARTIAL codes
+    # - 3-char PARTIAL codes: include 4-char EXTRA + 5+ char EXTRA
+    partial_ancestors = {code for code in partial_codes if len(code) == 3}
+
+    # Everything counted for strict is also counted for partial, so go
+    # through the EXTRA rows once, and only check PARTIAL codes for rows that
+    # aren't already counted under COMPLETE
     strict_extra_primary = 0
     strict_extra_secondary = 0
-
-    for extra_row in extra_codes:
-        extra_code = extra_row["icd10_code"]
-
-        for complete_code in complete_codes:
-            if is_descendant(extra_code, complete_code):
-                # Check conditions
-                if len(complete_code) == 4 and len(extra_code) >= 5:
-                    # 4-char COMPLETE: include 5+ char EXTRA
-                    strict_extra_primary += parse_count(extra_row["apcs_primary_count"])
-                    strict_extra_secondary += parse_count(
-                        extra_row["apcs_secondary_count"]
-                    )
-                    break
-                elif len(complete_code) == 3:
-                    # 3-char COMPLETE: include 4-char EXTRA + 5+ char EXTRA
-                    strict_extra_primary += parse_count(extra_row["apcs_primary_count"])
-                    strict_extra_secondary += parse_count(
-                        extra_row["apcs_secondary_count"]
-                    )
-                    break
+    partial_only_extra_primary = 0
+    partial_only_extra_secondary = 0
+
+    for extra_row, ancestor_codes in extra_codes:
+        if not complete_ancestors.isdisjoint(ancestor_codes):
+            strict_extra_primary += parse_count(extra_row["apcs_primary_count"])
+            strict_extra_secondary += parse_count(extra_row["apcs_secondary_count"])
+        elif not partial_ancestors.isdisjoint(ancestor_codes):
+            partial_only_extra_primary += parse_count(extra_row["apcs_primary_count"])
+            partial_only_extra_secondary += parse_count(
+                extra_row["apcs_secondary_count"]
+            )
 
     strict_primary = baseline_primary + strict_extra_primary
     strict_secondary = baseline_secondary + strict_extra_secondary
 
-    # Partial: Include EXTRA descendants of COMPLETE and PARTIAL codes
-    partial_extra_primary = 0
-    partial_extra_secondary = 0
-
-    for extra_row in extra_codes:
-        extra_code = extra_row["icd10_code"]
-
-        # Check COMPLETE codes (same as strict)
-        for complete_code in complete_codes:
-            if is_descendant(extra_code, complete_code):
-                if len(complete_code) == 4 and len(extra_code) >= 5:
-                    partial_extra_primary += parse_count(
-                        extra_row["apcs_primary_count"]
-                    )
-                    partial_extra_secondary += parse_count(
-                        extra_row["apcs_secondary_count"]
-                    )
-                    break
-                elif len(complete_code) == 3:
-                    partial_extra_primary += parse_count(
-                        extra_row["apcs_primary_count"]
-                    )
-                    partial_extra_secondary += parse_count(
-                        extra_row["apcs_secondary_count"]
-                    )
-                    break
-        else:
-            # Check PARTIAL codes (only if not already counted under COMPLETE)
-            for partial_code in partial_codes:
-                if is_descendant(extra_code, partial_code):
-                    if len(partial_code) == 3:
-                        # 3-char PARTIAL: include 4-char EXTRA + 5+ char EXTRA
-                        partial_extra_primary += parse_count(
-                            extra_row["apcs_primary_count"]
-                        )
-                        partial_extra_secondary += parse_count(
-                            extra_row["apcs_secondary_count"]
-                        )
-                        break
-
+    partial_extra_primary = strict_extra_primary + partial_only_extra_primary
+    partial_extra_secondary = strict_extra_secondary + partial_only_extra_secondary
     partial_primary = baseline_primary + partial_extra_primary
     partial_secondary = baseline_secondary + partial_extra_secondary
 
@@ -166,34 +183,32 @@ def analyze_primary_secondary(codelist_rows):
     }
 
 
-def analyze_none_uploaded(codelist_rows):
+def analyze_none_uploaded(codelist):
     """
     Analyze counts when including descendants of NONE codes (uploaded only).
 
+    codelist is the codelist's rows, as split by split_codelist.
+
     Returns dict with keys:
     - none_primary, none_secondary
     """
-    codelist_codes = [
-        r for r in codelist_rows if r["status"] in ["COMPLETE", "PARTIAL", "NONE"]
-    ]
-    extra_codes = [r for r in codelist_rows if r["status"] == "EXTRA"]
+    extra_codes = codelist["extras"]
 
     # Get NONE codes
-    none_codes = {r["icd10_code"] for r in codelist_codes if r["status"] == "NONE"}
+    none_codes = codelist["none"]
+    if not extra_codes or not none_codes:
+        return {"none_primary": 0, "none_secondary": 0}
 
     # Include EXTRA descendants of NONE codes
+    # - 3-char NONE: include 4-char EXTRA + 5+ char EXTRA
+    none_ancestors = {code for code in none_codes if len(code) == 3}
     none_extra_primary = 0
     none_extra_secondary = 0
 
-    for extra_row in extra_codes:
-        extra_code = extra_row["icd10_code"]
-
-        for none_code in none_codes:
-            if is_descendant(extra_code, none_code) and len(none_code) == 3:
-                # 3-char NONE: include 4-char EXTRA + 5+ char EXTRA
-                none_extra_primary += parse_count(extra_row["apcs_primary_count"])
-                none_extra_secondary += parse_count(extra_row["apcs_secondary_count"])
-                break
+    for extra_row, ancestor_codes in extra_codes:
+        if not none_ancestors.isdisjoint(ancestor_codes):
+            none_extra_primary += parse_count(extra_row["apcs_primary_count"])
+            none_extra_secondary += parse_count(extra_row["apcs_secondary_count"])
 
     return {
         "none_primary": none_extra_primary,
@@ -201,37 +216,33 @@ def analyze_none_uploaded(codelist_rows):
     }
 
 
-def analyze_all_count(codelist_rows):
+def analyze_all_count(codelist):
     """
     Analyze all_count field impact of prefix matching.
 
+    codelist is the codelist's rows, as split by split_codelist.
+
     Returns dict with keys:
     - baseline_all: COMPLETE + PARTIAL + NONE codes
     - with_partial_children_all: baseline + EXTRA children of PARTIAL codes
     """
-    codelist_codes = [
-        r for r in codelist_rows if r["status"] in ["COMPLETE", "PARTIAL", "NONE"]
-    ]
-    extra_codes = [r for r in codelist_rows if r["status"] == "EXTRA"]
+    codelist_codes = codelist["codes"]
+    extra_codes = codelist["extras"]
 
     # Baseline: only codelist codes
     baseline_all = sum(parse_count(r["apcs_all_count"]) for r in codelist_codes)
 
     # Get PARTIAL codes
-    partial_codes = {
-        r["icd10_code"] for r in codelist_codes if r["status"] == "PARTIAL"
-    }
+    partial_codes = codelist["partial"]
+    if not extra_codes or not partial_codes:
+        return {"baseline_all": baseline_all, "with_partial_children_all": baseline_all}
 
     # Include EXTRA descendants of PARTIAL codes
     partial_children_all = 0
 
-    for extra_row in extra_codes:
-        extra_code = extra_row["icd10_code"]
-
-        for partial_code in partial_codes:
-            if is_descendant(extra_code, partial_code):
-                partial_children_all += parse_count(extra_row["apcs_all_count"])
-                break
+    for extra_row, ancestor_codes in extra_codes:
+        if not partial_codes.isdisjoint(ancestor_codes):
+            partial_children_all += parse_count(extra_row["apcs_all_count"])
 
     return {
         "baseline_all": baseline_all,
@@ -248,12 +259,14 @@ def run_analysis():
     codelists = {}
     for row in data:
         codelist_id = row["codelist_id"]
-        if codelist_id not in codelists:
-            codelists[codelist_id] = {
+        # One lookup for every row after a codelist's first
+        info = codelists.get(codelist_id)
+        if info is None:
+            info = codelists[codelist_id] = {
                 "creation_method": row["creation_method"],
                 "rows": [],
             }
-        codelists[codelist_id]["rows"].append(row)
+        info["rows"].append(row)
 
     print(f"Found {len(codelists)} codelists")
 
@@ -261,19 +274,19 @@ def run_analysis():
     results = []
 
     for codelist_id, info in codelists.items():
-        rows = info["rows"]
+        codelist = split_codelist(info["rows"])
         creation_method = info["creation_method"]
 
         # Primary/Secondary analysis
-        ps_analysis = analyze_primary_secondary(rows)
+        ps_analysis = analyze_primary_secondary(codelist)
 
         # NONE analysis (only for uploaded)
         none_analysis = {"none_primary": 0, "none_secondary": 0}
         if creation_method == "Uploaded":
-            none_analysis = analyze_none_uploaded(rows)
+            none_analysis = analyze_none_uploaded(codelist)
 
         # All count analysis
-        all_analysis = analyze_all_count(rows)
+        all_analysis = analyze_all_count(codelist)
 
         result = {
             "codelist_id": codelist_id,
@@ -302,9 +315,10 @@ def run_analysis():
     ]
 
     with open(OUTPUT_CSV, "w", newline="") as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        writer.writeheader()
-        writer.writerows(results)
+        writer = csv.writer(f)
+        writer.writerow(fieldnames)
+        # Pick out each result's values in fieldnames order
+        writer.writerows(map(itemgetter(*fieldnames), results))
 
     # Generate summary statistics
     print(f"Writing markdown report to {OUTPUT_MD}...")
@@ -314,6 +328,53 @@ def run_analysis():
     return results
 
 
+# Count fields in the results that are totalled in the markdown report
+SUMMARY_FIELDS = [
+    "baseline_primary",
+    "strict_primary",
+    "partial_primary",
+    "none_primary",
+    "baseline_secondary",
+    "strict_secondary",
+    "partial_secondary",
+    "none_secondary",
+    "baseline_all",
+    "with_partial_children_all",
+]
+
+# Scenario fields that are compared against a baseline field in the markdown
+# report, to find the codelists each scenario leaves unaffected
+SCENARIO_BASELINES = {
+    "strict_primary": "baseline_primary",
+    "partial_primary": "baseline_primary",
+    "none_primary": "baseline_primary",
+    "strict_secondary": "baseline_secondary",
+    "partial_secondary": "baseline_secondary",
+    "none_secondary": "baseline_secondary",
+    "with_partial_children_all": "baseline_all",
+}
+
+
+def summarize(results):
+    """Summarize a list of results in a single pass for the markdown report.
+
+    Returns dict with keys:
+    - count: the number of results
+    - totals: the total of each of SUMMARY_FIELDS
+    - unaffected: for each of SCENARIO_BASELINES, the number of results where
+      the scenario is the same as its baseline
+    """
+    totals = dict.fromkeys(SUMMARY_FIELDS, 0)
+    unaffected = dict.fromkeys(SCENARIO_BASELINES, 0)
+    for r in results:
+        for key in SUMMARY_FIELDS:
+            totals[key] += r[key]
+        for scenario_key, baseline_key in SCENARIO_BASELINES.items():
+            if r[scenario_key] == r[baseline_key]:
+                unaffected[scenario_key] += 1
+    return {"count": len(results), "totals": totals, "unaffected": unaffected}
+
+
 def write_markdown_report(results):
     """Write a markdown summary report."""
     # Split by creation method
@@ -321,7 +382,15 @@ def write_markdown_report(results):
     uploaded_results = [r for r in results if r["creation_method"] == "Uploaded"]
     inline_results = [r for r in results if r["creation_method"] == "Inline"]
 
-    with open(OUTPUT_MD, "w") as f:
+    # Every table is made from these, so only go through each set of results once
+    summary = summarize(results)
+    builder_summary = summarize(builder_results)
+    uploaded_summary = summarize(uploaded_results)
+    inline_summary = summarize(inline_results)
+
+    # Build the report in memory and write it out in one go, so a failure
+    # part way through leaves the previous report in place
+    with io.StringIO() as f:
         f.write("# APCS missing ICD10 code analysis\n\n")
         f.write(
             "Analysis of how different prefix matching assumptions affect codelist coverage.\n\n"
@@ -376,15 +445,14 @@ def write_markdown_report(results):
         )
 
         # Primary counts analysis
-        write_scenario_table(f, results, "primary")
+        write_scenario_table(f, summary, "primary")
 
         f.write("### Unaffected Codelists\n\n")
         write_unaffected_table(
             f,
-            results,
-            builder_results,
-            uploaded_results,
-            field="primary",
+            summary,
+            builder_summary,
+            uploaded_summary,
             comparisons=[
                 ("Strict vs Baseline", "strict_primary"),
                 ("Partial vs Baseline", "partial_primary"),
@@ -393,16 +461,15 @@ def write_markdown_report(results):
 
         f.write("\n### By Creation Method\n\n")
         f.write("#### Builder Codelists\n\n")
-        write_scenario_table(f, builder_results, "primary")
+        write_scenario_table(f, builder_summary, "primary")
 
         f.write("\n#### Uploaded Codelists\n\n")
-        write_uploaded_scenario_table(f, uploaded_results, "primary")
+        write_uploaded_scenario_table(f, uploaded_summary, "primary")
         write_unaffected_table(
             f,
-            uploaded_results,
-            builder_results=None,
-            uploaded_results=uploaded_results,
-            field="primary",
+            uploaded_summary,
+            builder_summary=None,
+            uploaded_summary=uploaded_summary,
             comparisons=[
                 ("Strict vs Baseline", "strict_primary"),
                 ("Partial vs Baseline", "partial_primary"),
@@ -411,13 +478,12 @@ def write_markdown_report(results):
         )
 
         f.write("\n#### Inline Codelists\n\n")
-        write_uploaded_scenario_table(f, inline_results, "primary")
+        write_uploaded_scenario_table(f, inline_summary, "primary")
         write_unaffected_table(
             f,
-            inline_results,
-            builder_results=None,
-            uploaded_results=inline_results,
-            field="primary",
+            inline_summary,
+            builder_summary=None,
+            uploaded_summary=inline_summary,
             comparisons=[
                 ("Strict vs Baseline", "strict_primary"),
                 ("Partial vs Baseline", "partial_primary"),
@@ -429,15 +495,14 @@ def write_markdown_report(results):
         f.write(
             "This field is exactly the same as the primary diagnosis field so we just repeat the above analysis here.\n\n"
         )
-        write_scenario_table(f, results, "secondary")
+        write_scenario_table(f, summary, "secondary")
 
         f.write("### Unaffected Codelists\n\n")
         write_unaffected_table(
             f,
-            results,
-            builder_results,
-            uploaded_results,
-            field="secondary",
+            summary,
+            builder_summary,
+            uploaded_summary,
             comparisons=[
                 ("Strict vs Baseline", "strict_secondary"),
                 ("Partial vs Baseline", "partial_secondary"),
@@ -446,16 +511,15 @@ def write_markdown_report(results):
 
         f.write("\n### By Creation Method\n\n")
         f.write("#### Builder Codelists\n\n")
-        write_scenario_table(f, builder_results, "secondary")
+        write_scenario_table(f, builder_summary, "secondary")
 
         f.write("\n#### Uploaded Codelists\n\n")
-        write_uploaded_scenario_table(f, uploaded_results, "secondary")
+        write_uploaded_scenario_table(f, uploaded_summary, "secondary")
         write_unaffected_table(
             f,
-            uploaded_results,
-            builder_results=None,
-            uploaded_results=uploaded_results,
-            field="secondary",
+            uploaded_summary,
+            builder_summary=None,
+            uploaded_summary=uploaded_summary,
             comparisons=[
                 ("Strict vs Baseline", "strict_secondary"),
                 ("Partial vs Baseline", "partial_secondary"),
@@ -464,13 +528,12 @@ def write_markdown_report(results):
         )
 
         f.write("\n#### Inline Codelists\n\n")
-        write_uploaded_scenario_table(f, inline_results, "secondary")
+        write_uploaded_scenario_table(f, inline_summary, "secondary")
         write_unaffected_table(
             f,
-            inline_results,
-            builder_results=None,
-            uploaded_results=inline_results,
-            field="secondary",
+            inline_summary,
+            builder_summary=None,
+            uploaded_summary=inline_summary,
             comparisons=[
                 ("Strict vs Baseline", "strict_secondary"),
                 ("Partial vs Baseline", "partial_secondary"),
@@ -499,15 +562,14 @@ def write_markdown_report(results):
             "|Baseline| Total event count in this field using just codes in the codelist|\n"
             "|With PARTIAL descendants| Total event count when including codes that are children of `PARTIAL` codes|\n\n"
         )
-        write_all_table(f, results)
+        write_all_table(f, summary)
 
         f.write("### Unaffected Codelists\n\n")
         write_unaffected_table(
             f,
-            results,
-            builder_results,
-            uploaded_results,
-            field="all",
+            summary,
+            builder_summary,
+            uploaded_summary,
             comparisons=[
                 ("PARTIAL descendants vs Baseline", "with_partial_children_all"),
             ],
@@ -515,21 +577,23 @@ def write_markdown_report(results):
 
         f.write("\n### By Creation Method\n\n")
         f.write("#### Builder Codelists\n\n")
-        write_all_table(f, builder_results)
+        write_all_table(f, builder_summary)
 
         f.write("\n#### Uploaded Codelists\n\n")
-        write_all_table(f, uploaded_results)
+        write_all_table(f, uploaded_summary)
 
+        report = f.getvalue()
 
-def write_scenario_table(f, results, field):
-    """Write a table comparing baseline, strict, and partial scenarios."""
-    baseline_key = f"baseline_{field}"
-    strict_key = f"strict_{field}"
-    partial_key = f"partial_{field}"
+    with open(OUTPUT_MD, "w") as out:
+        out.write(report)
 
-    total_baseline = sum(r[baseline_key] for r in results)
-    total_strict = sum(r[strict_key] for r in results)
-    total_partial = sum(r[partial_key] for r in results)
+
+def write_scenario_table(f, summary, field):
+    """Write a table comparing baseline, strict, and partial scenarios."""
+    totals = summary["totals"]
+    total_baseline = totals[f"baseline_{field}"]
+    total_strict = totals[f"strict_{field}"]
+    total_partial = totals[f"partial_{field}"]
 
     strict_diff = total_strict - total_baseline
     partial_diff = total_partial - total_baseline
@@ -547,17 +611,13 @@ def write_scenario_table(f, results, field):
     f.write("\n")
 
 
-def write_uploaded_scenario_table(f, results, field):
+def write_uploaded_scenario_table(f, summary, field):
     """Write a table comparing baseline, strict, partial, and lax scenarios for uploaded codelists."""
-    baseline_key = f"baseline_{field}"
-    strict_key = f"strict_{field}"
-    partial_key = f"partial_{field}"
-    none_key = f"none_{field}"
-
-    total_baseline = sum(r[baseline_key] for r in results)
-    total_strict = sum(r[strict_key] for r in results)
-    total_partial = sum(r[partial_key] for r in results)
-    total_none = sum(r[none_key] for r in results)
+    totals = summary["totals"]
+    total_baseline = totals[f"baseline_{field}"]
+    total_strict = totals[f"strict_{field}"]
+    total_partial = totals[f"partial_{field}"]
+    total_none = totals[f"none_{field}"]
     total_lax = total_baseline + total_none
 
     strict_diff = total_strict - total_baseline
@@ -579,13 +639,11 @@ def write_uploaded_scenario_table(f, results, field):
     f.write("\n")
 
 
-def write_none_table(f, results, field):
+def write_none_table(f, summary, field):
     """Write a table showing impact of including NONE descendants."""
-    baseline_key = f"baseline_{field}"
-    none_key = f"none_{field}"
-
-    total_baseline = sum(r[baseline_key] for r in results)
-    total_none_extra = sum(r[none_key] for r in results)
+    totals = summary["totals"]
+    total_baseline = totals[f"baseline_{field}"]
+    total_none_extra = totals[f"none_{field}"]
     total_with_none = total_baseline + total_none_extra
 
     none_pct = (total_none_extra / total_baseline * 100) if total_baseline > 0 else 0
@@ -599,10 +657,10 @@ def write_none_table(f, results, field):
     f.write("\n")
 
 
-def write_all_table(f, results):
+def write_all_table(f, summary):
     """Write a table showing impact of PARTIAL prefix matching."""
-    total_baseline = sum(r["baseline_all"] for r in results)
-    total_with_partial = sum(r["with_partial_children_all"] for r in results)
+    total_baseline = summary["totals"]["baseline_all"]
+    total_with_partial = summary["totals"]["with_partial_children_all"]
 
     diff = total_with_partial - total_baseline
     pct = (diff / total_baseline * 100) if total_baseline > 0 else 0
@@ -618,18 +676,20 @@ def write_all_table(f, results):
 
 def write_unaffected_table(
     f,
-    all_results,
-    builder_results,
-    uploaded_results,
+    all_summary,
+    builder_summary,
+    uploaded_summary,
     *,
-    field,
     comparisons,
 ):
-    """Write a table showing codelists unaffected by each scenario."""
+    """Write a table showing codelists unaffected by each scenario.
+
+    The baseline each scenario is compared against is in SCENARIO_BASELINES.
+    """
 
-    def unaffected_counts(dataset, baseline_key, scenario_key):
-        total = len(dataset)
-        unaffected = sum(1 for r in dataset if r[baseline_key] == r[scenario_key])
+    def unaffected_counts(summary, scenario_key):
+        total = summary["count"]
+        unaffected = summary["unaffected"][scenario_key]
         pct = (unaffected / total * 100) if total > 0 else 0
         return total, unaffected, pct
 
@@ -638,29 +698,21 @@ def write_unaffected_table(
             return "-"
         return f"{unaffected}/{total} ({pct:.1f}%)"
 
-    baseline_key = "baseline_all" if field == "all" else f"baseline_{field}"
-
     f.write("| Comparison | All Codelists | Builder | Uploaded |\n")
     f.write("|------------|--------------|---------|----------|\n")
 
     for label, scenario_key in comparisons:
-        all_total, all_unaff, all_pct = unaffected_counts(
-            all_results, baseline_key, scenario_key
-        )
+        all_total, all_unaff, all_pct = unaffected_counts(all_summary, scenario_key)
         row = [label, fmt(all_total, all_unaff, all_pct)]
 
-        if builder_results is not None:
-            b_total, b_unaff, b_pct = unaffected_counts(
-                builder_results, baseline_key, scenario_key
-            )
+        if builder_summary is not None:
+            b_total, b_unaff, b_pct = unaffected_counts(builder_summary, scenario_key)
             row.append(fmt(b_total, b_unaff, b_pct))
         else:
             row.append("-")
 
-        if uploaded_results is not None:
-            u_total, u_unaff, u_pct = unaffected_counts(
-                uploaded_results, baseline_key, scenario_key
-            )
+        if uploaded_summary is not None:
+            u_total, u_unaff, u_pct = unaffected_counts(uploaded_summary, scenario_key)
             row.append(fmt(u_total, u_unaff, u_pct))
         else:
             row.append("-")
@@ -689,9 +741,7 @@ def calculate_x_padding_events(codelist_id):
 
     # Get codes that are in the codelist (status = COMPLETE/PARTIAL/NONE)
     codelist_codes = {
-        r["icd10_code"]
-        for r in codelist_rows
-        if r["status"] in ["COMPLETE", "PARTIAL", "NONE"]
+        r["icd10_code"] for r in codelist_rows if r["status"] in CODELIST_STATUSES
     }
 
     # Get 3-character codes in the codelist
@@ -719,13 +769,20 @@ def load_prefix_matching_results():
     coverage_data, _ = get_apcs_coverage_data()
 
     with open(OUTPUT_CSV) as f:
-        reader = csv.DictReader(f)
+        # Only a few columns are needed, so read them by position
+        reader = csv.reader(f)
+        header = next(reader)
+        id_index = header.index("codelist_id")
+        baseline_index = header.index("baseline_primary")
+        strict_index = header.index("strict_primary")
+        partial_index = header.index("partial_primary")
+        none_index = header.index("none_primary")
         for row in reader:
-            codelist_id = row["codelist_id"]
-            baseline_primary = int(row.get("baseline_primary", 0))
-            strict_primary = int(row.get("strict_primary", 0))
-            partial_primary = int(row.get("partial_primary", 0))
-            none_primary = int(row.get("none_primary", 0))
+            codelist_id = row[id_index]
+            baseline_primary = int(row[baseline_index])
+            strict_primary = int(row[strict_index])
+            partial_primary = int(row[partial_index])
+            none_primary = int(row[none_index])
 
             # Check if there's a discrepancy
             # - strict != baseline: COMPLETE codes have EXTRA descendants
@@ -750,7 +807,7 @@ def load_prefix_matching_results():
                 codelist_codes = {
                     r["icd10_code"]
                     for r in codelist_rows
-                    if r["status"] in ["COMPLETE", "PARTIAL", "NONE"]
+                    if r["status"] in CODELIST_STATUSES
                 }
 
                 # Get 3-character codes in the codelist
@@ -772,14 +829,15 @@ def load_prefix_matching_results():
 
                 with_x_padding = baseline_primary + x_padding_primary
 
-                # Calculate percentage increase from baseline to with_prefix_matching
+                # Format percentage increase from baseline to with_prefix_matching
                 if baseline_primary > 0:
                     pct_diff = (
                         (with_prefix_matching - baseline_primary) / baseline_primary
                     ) * 100
+                    pct_str = f"{round(pct_diff)}%"
                 else:
                     # Mark as "Infinite" when baseline is 0
-                    pct_diff = None
+                    pct_str = "Infinite"
 
                 discrepancies.append(
                     {
@@ -787,7 +845,7 @@ def load_prefix_matching_results():
                         "baseline_primary": baseline_primary,
                         "with_x_padding": with_x_padding,
                         "with_prefix_matching": with_prefix_matching,
-                        "pct_difference": pct_diff,
+                        "percentage_increase": pct_str,
                     }
                 )
 
@@ -804,69 +862,52 @@ def map_to_repos():
     codelist_to_repos = load_ehrql_codelists_to_repos()
     print(f"  Mapped {len(codelist_to_repos)} codelists to repos")
 
-    # Build output rows
+    # Build output rows, in the order of the fieldnames below
     output_rows = []
+    repos_seen = set()
     for disc in discrepancies:
         codelist_id = disc["codelist_id"]
         repos = codelist_to_repos.get(codelist_id, set())
 
-        # Format percentage increase
-        if disc["pct_difference"] is None:
-            pct_str = "Infinite"
-        else:
-            pct_str = f"{round(disc['pct_difference'])}%"
-
+        counts = (
+            disc["baseline_primary"],
+            disc["with_x_padding"],
+            disc["with_prefix_matching"],
+            disc["percentage_increase"],
+        )
         if repos:
-            for repo in sorted(repos):
-                output_rows.append(
-                    {
-                        "repo": repo,
-                        "codelist": codelist_id,
-                        "current_event_count": disc["baseline_primary"],
-                        "event_count_with_x_padding": disc["with_x_padding"],
-                        "event_count_with_prefix_matching": disc[
-                            "with_prefix_matching"
-                        ],
-                        "percentage_increase": pct_str,
-                    }
-                )
+            for repo in repos:
+                output_rows.append((repo, codelist_id, *counts))
+            repos_seen.update(repos)
         else:
             # Include codelists that weren't found in any repo (for reference)
-            output_rows.append(
-                {
-                    "repo": "(not found in repos)",
-                    "codelist": codelist_id,
-                    "current_event_count": disc["baseline_primary"],
-                    "event_count_with_x_padding": disc["with_x_padding"],
-                    "event_count_with_prefix_matching": disc["with_prefix_matching"],
-                    "percentage_increase": pct_str,
-                }
-            )
+            output_rows.append(("(not found in repos)", codelist_id, *counts))
+            repos_seen.add("(not found in repos)")
 
-    # Sort by repo, then codelist
-    output_rows.sort(key=lambda x: (x["repo"], x["codelist"]))
+    # Sort by repo, then codelist. Each codelist only has one row for each repo,
+    # so comparing the whole tuples gives the same order
+    output_rows.sort()
 
     # Write CSV
     print(f"Writing repo mapping to {REPOS_OUTPUT_FILE}...")
     with open(REPOS_OUTPUT_FILE, "w", newline="") as f:
-        writer = csv.DictWriter(
-            f,
-            fieldnames=[
+        writer = csv.writer(f)
+        writer.writerow(
+            [
                 "repo",
                 "codelist",
                 "current_event_count",
                 "event_count_with_x_padding",
                 "event_count_with_prefix_matching",
                 "percentage_increase",
-            ],
+            ]
         )
-        writer.writeheader()
         writer.writerows(output_rows)
 
     print(f"\nWrote {len(output_rows)} rows to {REPOS_OUTPUT_FILE}")
     print(
         f"Summary: {len(discrepancies)} codelists with discrepancies "
-        f"across {len(set(r['repo'] for r in output_rows))} repos"
+        f"across {len(repos_seen)} repos"
     )
 
 
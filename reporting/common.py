@@ -1,16 +1,26 @@
 import csv
 import hashlib
 import json
+import pickle
 import re
 import subprocess
 import sys
 import time
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from pathlib import Path
 from urllib.error import HTTPError, URLError
 from urllib.request import Request, urlopen
 
 
+# orjson is optional, but parses the large JSON exports much faster
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
 REPO_ROOT = Path(__file__).parent.parent
 REPORTING_DIR = REPO_ROOT / "reporting"
 DATA_DIR = REPORTING_DIR / "data"
@@ -38,11 +48,13 @@ def load_ocl_codes() -> dict[str, set[str]]:
         "apcs": set(),
         "ons_deaths": set(),
     }
+    # Read the whole file at once, which is quicker than iterating over it line by line
     with open(OCL_ICD10_2019_CODES_FILE) as f:
-        for line in f:
-            code = line.strip()
-            if code and "-" not in code:  # ocl contains code ranges which we'll ignore
-                ocl_codes["ons_deaths"].add(code)
+        lines = f.read().splitlines()
+    for line in lines:
+        code = line.strip()
+        if code and "-" not in code:  # ocl contains code ranges which we'll ignore
+            ocl_codes["ons_deaths"].add(sys.intern(code))
     # Should be at least 12,000
     assert len(ocl_codes["ons_deaths"]) >= 12000, "Loaded too few ICD10 codes from OCL"
 
@@ -52,22 +64,74 @@ def load_ocl_codes() -> dict[str, set[str]]:
             f"Known ICD10 code {known_code} missing from OCL codes"
         )
 
+    # 3-char codes which have children in OCL
+    parent_codes = {code[:3] for code in ocl_codes["ons_deaths"] if len(code) > 3}
+
     # Now we create the APCS OCL codes set by adding 4-char codes with X suffixes
     for code in ocl_codes["ons_deaths"]:
         if len(code) != 3:
             ocl_codes["apcs"].add(code)
-        else:
-            # Check if this 3-char code has any children in OCL
-            has_children = any(
-                other_code.startswith(code) and len(other_code) > 3
-                for other_code in ocl_codes["ons_deaths"]
-            )
-            if not has_children:
-                # Add the 4-char code with X suffix
-                ocl_codes["apcs"].add(f"{code}X")
+        elif code not in parent_codes:
+            # Add the 4-char code with X suffix
+            ocl_codes["apcs"].add(sys.intern(f"{code}X"))
     return ocl_codes
 
 
+def load_json_with_cache(path):
+    """Load a JSON file, using a pickled copy from a previous run if there is one.
+
+    The large JSON exports are re-parsed on every run, and unpickling is much
+    faster than parsing JSON. The pickle is stored in a .cache directory next
+    to the JSON file, and is keyed on the file's path, size and modification
+    time, so it is ignored once the file changes.
+    """
+    path = Path(path)
+    stat = path.stat()
+    key = hashlib.sha1(
+        f"{path.resolve()}:{stat.st_size}:{stat.st_mtime_ns}".encode()
+    ).hexdigest()
+    cache_path = path.parent / ".cache" / f"{path.stem}-{key}.pkl"
+
+    try:
+        with open(cache_path, "rb") as f:
+            return pickle.load(f)
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        # Unpickling a stale or truncated file can raise almost anything, and
+        # reading the cache must never be fatal, so drop it and parse the JSON
+        print(
+            f"  WARNING: Ignoring unreadable cache {cache_path}: {e}", file=sys.stderr
+        )
+        try:
+            cache_path.unlink(missing_ok=True)
+        except OSError:
+            pass
+
+    if orjson is not None:
+        # orjson.JSONDecodeError subclasses json.JSONDecodeError, so callers
+        # can catch the same exception either way
+        data = orjson.loads(path.read_bytes())
+    else:
+        with open(path) as f:
+            data = json.load(f)
+
+    try:
+        cache_path.parent.mkdir(exist_ok=True)
+        # Write to a temporary file first so a partial pickle is never read
+        tmp_path = cache_path.with_suffix(".tmp")
+        with open(tmp_path, "wb") as f:
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        tmp_path.replace(cache_path)
+        # Remove pickles of earlier versions of the file, which won't be used again
+        for old_path in cache_path.parent.glob(f"{path.stem}-{'?' * len(key)}.pkl"):
+            if old_path != cache_path:
+                old_path.unlink(missing_ok=True)
+    except OSError as e:
+        print(f"  WARNING: Could not cache {path}: {e}", file=sys.stderr)
+    return data
+
+
 _rsi_data = None
 
 
@@ -82,8 +146,7 @@ def _get_rsi_data():
             return None
 
         try:
-            with open(RSI_JSON_FILE) as f:
-                _rsi_data = json.load(f)
+            _rsi_data = load_json_with_cache(RSI_JSON_FILE)
         except (OSError, json.JSONDecodeError) as e:
             print(f"  WARNING: Could not load RSI codelists: {e}", file=sys.stderr)
             return None
@@ -129,6 +192,19 @@ def load_rsi_codelists():
     return codelist_map
 
 
+def find_rsi_metadata(codelist_id, rsi_map):
+    """Find the RSI metadata for a codelist ID, or None if it isn't there.
+
+    IDs are looked up by their full version slug first, and then by their last
+    part, which is the version hash for user codelists.
+    """
+    metadata = rsi_map.get(codelist_id)
+    if metadata is None:
+        # Try hash-only match
+        metadata = rsi_map.get(codelist_id.strip("/").rpartition("/")[2])
+    return metadata
+
+
 def load_all_icd10_codelists_from_rsi():
     """Load ALL ICD-10 codelist versions from the RSI export.
 
@@ -160,11 +236,14 @@ def load_all_icd10_codelists_from_rsi():
     return all_versions
 
 
-def load_usage_data(data_source):
+def load_usage_data(data_source, raw_usage_year=None):
     """Load code usage data from CSV for a specific data source.
 
     Args:
         data_source: Either 'apcs' or 'ons_deaths'
+        raw_usage_year: If given, only keep raw values for this financial year
+            (e.g. '2024-25'), so that callers needing one year don't hold the
+            raw values for every year
 
     Returns: tuple of (usage, raw_usage)
     - usage: dict of {code: {(category, year): count}} with processed values
@@ -172,8 +251,9 @@ def load_usage_data(data_source):
     where category is like 'apcs_primary_count', 'ons_contributing_count', etc.
     """
     usage_file = USAGE_FILE_APCS if data_source == "apcs" else USAGE_FILE_ONS_DEATHS
-    usage = defaultdict(lambda: defaultdict(int))
-    raw_usage = defaultdict(lambda: defaultdict(str))
+    # partial rather than lambda factories, so the results can be pickled
+    usage = defaultdict(partial(defaultdict, int))
+    raw_usage = defaultdict(partial(defaultdict, str))
 
     columns = (
         ["apcs_primary_count", "apcs_secondary_count", "apcs_all_count"]
@@ -184,25 +264,48 @@ def load_usage_data(data_source):
         ]
     )
 
-    with open(usage_file) as f:
-        reader = csv.DictReader(f)
+    with open(usage_file, newline="", buffering=1 << 20) as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:
+            # An empty file has no usage
+            return usage, raw_usage
+        code_index = header.index("icd10_code")
+        year_index = header.index("financial_year")
+        # Find each column's position once. Columns missing from the file
+        # count as blank. The TOTAL key for each column is the same on every row.
+        column_total_keys = [
+            (
+                header.index(column) if column in header else None,
+                column,
+                (column, "TOTAL"),
+            )
+            for column in columns
+        ]
+
         for row in reader:
-            code = row["icd10_code"]
-            year = row["financial_year"]
+            if not row:
+                continue
+            code = row[code_index]
+            year = row[year_index]
 
             if not code:
                 continue
-
-            for column in columns:
-                count_str = row.get(column, "")
+            code = sys.intern(code)
+
+            # Look up this code's dicts once per row, not once per column
+            code_usage = usage[code]
+            keep_raw = raw_usage_year is None or year == raw_usage_year
+            if keep_raw:
+                code_raw_usage = raw_usage[code]
+            for index, column, total_key in column_total_keys:
+                count_str = row[index] if index is not None else ""
                 count = parse_value(count_str)
-                raw_usage[code][(column, year)] = count_str
-                usage[code][(column, year)] += count
-
-                if (column, "TOTAL") not in usage[code]:
-                    usage[code][(column, "TOTAL")] = count
-                else:
-                    usage[code][(column, "TOTAL")] += count
+                key = (column, year)
+                if keep_raw:
+                    code_raw_usage[key] = count_str
+                code_usage[key] += count
+                code_usage[total_key] += count
 
     return usage, raw_usage
 
@@ -246,6 +349,23 @@ def download_codelist(codelist_id):
         return None
 
 
+def download_missing_codelists(codelist_ids, max_workers=16):
+    """Download any codelists that aren't already cached.
+
+    Downloads are network bound, so they are run concurrently in threads.
+    """
+    missing = []
+    for codelist_id in codelist_ids:
+        cache_filename = codelist_id.strip("/").replace("/", "_") + ".csv"
+        if not (CACHE_DIR / cache_filename).exists():
+            missing.append(codelist_id)
+
+    if missing:
+        print(f"  Downloading {len(missing)} uncached codelists...", file=sys.stderr)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            list(executor.map(download_codelist, missing))
+
+
 def parse_codelist(filename):
     cache_path = CACHE_DIR / filename
     codes = set()
@@ -259,7 +379,9 @@ def parse_codelist(filename):
             for row in reader:
                 code = row.get(code_col, "").strip()
                 if code:
-                    codes.add(code)
+                    # The same codes appear in many codelists, so share one
+                    # copy of each
+                    codes.add(sys.intern(code))
     except Exception as e:
         print(f"Error loading {filename}: {e}", file=sys.stderr)
         return None
@@ -316,8 +438,7 @@ def _get_ehrql_data() -> dict:
             return {}
 
         try:
-            with open(EHRQL_JSON_FILE) as f:
-                _ehrql_data = json.load(f)
+            _ehrql_data = load_json_with_cache(EHRQL_JSON_FILE)
         except (OSError, json.JSONDecodeError) as e:
             print(f"  WARNING: Could not load ehrql JSON file: {e}", file=sys.stderr)
             return {}
@@ -370,7 +491,7 @@ def load_icd10_codelists(rsi_map):
 
     Returns:
         Tuple of (codelist_ids, inline_codelists) where inline_codelists are dicts with
-        'id' (synthetic ID) and 'codes' (set of codes).
+        'id' (synthetic ID) and 'codes' (frozenset of codes).
     """
     # Extract codelist IDs from ehrql file
     codelist_ids, inline_tuples = extract_codelist_ids()
@@ -378,24 +499,14 @@ def load_icd10_codelists(rsi_map):
     # Filter named codelists for ICD-10 only
     icd10_codelists = []
     for codelist_id in codelist_ids:
-        if codelist_id in rsi_map:
-            coding_system = rsi_map[codelist_id]["coding_system"].lower()
-            if coding_system == "icd10":
-                icd10_codelists.append(codelist_id)
-        else:
-            # Try hash-only match
-            parts = codelist_id.strip("/").split("/")
-            if parts:
-                last_part = parts[-1]
-                if last_part in rsi_map:
-                    coding_system = rsi_map[last_part]["coding_system"].lower()
-                    if coding_system == "icd10":
-                        icd10_codelists.append(codelist_id)
-                else:
-                    print(
-                        f"  WARNING: Codelist {codelist_id} not found in RSI metadata",
-                        file=sys.stderr,
-                    )
+        metadata = find_rsi_metadata(codelist_id, rsi_map)
+        if metadata is None:
+            print(
+                f"  WARNING: Codelist {codelist_id} not found in RSI metadata",
+                file=sys.stderr,
+            )
+        elif metadata["coding_system"].lower() == "icd10":
+            icd10_codelists.append(codelist_id)
 
     # Process inline codelists - filter for ICD-10 codes only
     inline_codelists = []
@@ -410,7 +521,7 @@ def load_icd10_codelists(rsi_map):
             inline_codelists.append(
                 {
                     "id": inline_id,
-                    "codes": set(code_tuple),
+                    "codes": frozenset(sys.intern(code) for code in code_tuple),
                     "codes_str": codes_str,  # Keep full description for reporting
                 }
             )
@@ -423,16 +534,18 @@ def load_icd10_codelists(rsi_map):
     return sorted(icd10_codelists), inline_codelists
 
 
+# Pattern: Capital letter, then 2-4 characters that are digits or X
+# But X should only appear as the 4th character (position 3)
+ICD10_CODE_RE = re.compile(r"^[A-Z]\d{2}[0-9X]?[0-9]?$")
+
+
 def is_icd10_code(code):
     """Check if a code matches ICD-10 format.
 
     ICD-10 format: Capital letter, followed by 2-4 digits, optionally with 'X' as 4th character.
     Examples: E10, E110, E1101, E10X, M907, S92X, S92X0
     """
-    # Pattern: Capital letter, then 2-4 characters that are digits or X
-    # But X should only appear as the 4th character (position 3)
-    pattern = r"^[A-Z]\d{2}[0-9X]?[0-9]?$"
-    return bool(re.match(pattern, code))
+    return ICD10_CODE_RE.match(code) is not None
 
 
 def load_ehrql_codelists_to_repos():
@@ -449,7 +562,8 @@ def load_ehrql_codelists_to_repos():
     projects = data.get("projects", {})
     for repo_name, commit_dict in projects.items():
         if isinstance(commit_dict, dict):
-            for _, file_hash in commit_dict.items():
+            # Many commits share a file hash, so only add the repo once for each
+            for file_hash in set(commit_dict.values()):
                 file_hash_to_repos[file_hash].add(repo_name)
 
     # Build mapping: codelist_id -> set of repos
@@ -458,8 +572,10 @@ def load_ehrql_codelists_to_repos():
     # Navigate signatures structure: hash -> filename -> variable -> codelist_list
     signatures = data.get("signatures", {})
     for file_hash, files in signatures.items():
-        # Get repos that use this file hash
-        repos_for_hash = file_hash_to_repos.get(file_hash, set())
+        # Get repos that use this file hash, skipping files no repo uses
+        repos_for_hash = file_hash_to_repos.get(file_hash)
+        if not repos_for_hash:
+            continue
 
         for file_name, variables in files.items():
             if file_name == "_unused_codelists":
@@ -467,11 +583,12 @@ def load_ehrql_codelists_to_repos():
             for _, codelist_list in variables.items():
                 # codelist_list is a list of entries, each starting with codelist_id
                 for entry in codelist_list:
-                    if entry and len(entry) > 0:
-                        codelist_id = entry[0]
-                        if codelist_id and codelist_id != "<inline>":
-                            # Add all repos that use this file hash
-                            codelist_to_repos[codelist_id].update(repos_for_hash)
+                    if not entry:
+                        continue
+                    codelist_id = entry[0]
+                    if codelist_id and codelist_id != "<inline>":
+                        # Add all repos that use this file hash
+                        codelist_to_repos[codelist_id].update(repos_for_hash)
 
     return codelist_to_repos
 
@@ -499,6 +616,9 @@ def parse_value(value):
 _coverage_data = []
 _codelist_codes = defaultdict(list)
 
+# Columns of the coverage detail CSV with a small number of distinct values
+COVERAGE_INTERNED_COLUMNS = ("codelist_id", "creation_method", "icd10_code", "status")
+
 
 def get_apcs_coverage_data():
     """Load the codelist coverage detail CSV."""
@@ -509,10 +629,23 @@ def get_apcs_coverage_data():
     _coverage_data = []
     _codelist_codes = defaultdict(list)
     with open(COVERAGE_APCS_FILE) as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            if row.get("Exists in ehrQL repo") != "Y":
+        # Use a plain reader, and only make dicts for the rows that are kept
+        reader = csv.reader(f)
+        header = next(reader, [])
+        if "Exists in ehrQL repo" not in header:
+            return _coverage_data, _codelist_codes
+        ehrql_index = header.index("Exists in ehrQL repo")
+        interned_indices = [
+            i for i, name in enumerate(header) if name in COVERAGE_INTERNED_COLUMNS
+        ]
+        for values in reader:
+            if len(values) <= ehrql_index or values[ehrql_index] != "Y":
                 continue
+            # These repeat across many rows, so share one string for each value
+            for i in interned_indices:
+                if i < len(values) and values[i]:
+                    values[i] = sys.intern(values[i])
+            row = dict(zip(header, values))
             _coverage_data.append(row)
             codelist_id = row.get("codelist_id", "").strip()
             icd10_code = row.get("icd10_code", "").strip()
@@ -129,7 +129,7 @@ def mock_data_files(tmp_path, monkeypatch):
 
 def test_get_descendants():
     """Test getting descendants of a code."""
-    all_codes = {"E10", "E100", "E101", "E109", "E11"}
+    all_codes = ["E10", "E100", "E101", "E109", "E11"]
 
     descendants = acc.get_descendants("E10", all_codes)
 
@@ -142,17 +142,48 @@ def test_get_descendants():
 
 def test_get_descendants_no_children():
     """Test getting descendants when code has no children."""
-    all_codes = {"E119", "I10"}
+    all_codes = ["E119", "I10"]
 
     descendants = acc.get_descendants("E119", all_codes)
 
     assert len(descendants) == 0
 
 
+def test_get_descendants_matches_prefix_scan():
+    """Test the bisection finds exactly the codes a prefix scan would."""
+    all_codes = sorted(
+        ["A00", "A000", "A00X", "A01", "E1", "E10", "E100", "E10X", "E11", "Z99"]
+    )
+
+    for code in all_codes + ["A", "E", "E0", "E109", "Z"]:
+        expected = [c for c in all_codes if c != code and c.startswith(code)]
+        assert acc.get_descendants(code, all_codes) == expected
+
+
+def test_count_descendants():
+    """Test counting descendants agrees with getting them."""
+    all_codes = ["E10", "E100", "E101", "E109", "E11"]
+
+    for code in all_codes + ["", "E", "E1", "E12"]:
+        assert acc.count_descendants(code, all_codes) == len(
+            acc.get_descendants(code, all_codes)
+        )
+
+
+def test_contains_code():
+    """Test membership checks against a sorted list of codes."""
+    all_codes = ["E10", "E100", "E11"]
+
+    assert acc.contains_code(all_codes, "E100")
+    assert not acc.contains_code(all_codes, "E1")
+    assert not acc.contains_code(all_codes, "E12")
+    assert not acc.contains_code([], "E10")
+
+
 def test_classify_code_descendants_complete():
     """Test classifying a code as COMPLETE."""
-    codelist_codes = {"E10", "E100", "E101", "E109"}
-    hierarchy_codes = {"E10", "E100", "E101", "E109"}
+    codelist_codes = ["E10", "E100", "E101", "E109"]
+    hierarchy_codes = ["E10", "E100", "E101", "E109"]
 
     result = acc.classify_code_descendants("E10", codelist_codes, hierarchy_codes)
 
@@ -161,8 +192,8 @@ def test_classify_code_descendants_complete():
 
 def test_classify_code_descendants_partial():
     """Test classifying a code as PARTIAL."""
-    codelist_codes = {"E10", "E100"}  # Missing E101, E109
-    hierarchy_codes = {"E10", "E100", "E101", "E109"}
+    codelist_codes = ["E10", "E100"]  # Missing E101, E109
+    hierarchy_codes = ["E10", "E100", "E101", "E109"]
 
     result = acc.classify_code_descendants("E10", codelist_codes, hierarchy_codes)
 
@@ -171,18 +202,45 @@ def test_classify_code_descendants_partial():
 
 def test_classify_code_descendants_none():
     """Test classifying a code as NONE."""
-    codelist_codes = {"E10"}  # No descendants in codelist
-    hierarchy_codes = {"E10", "E100", "E101", "E109"}
+    codelist_codes = ["E10"]  # No descendants in codelist
+    hierarchy_codes = ["E10", "E100", "E101", "E109"]
 
     result = acc.classify_code_descendants("E10", codelist_codes, hierarchy_codes)
 
     assert result == "NONE"
 
 
+def test_classify_code_descendants_partial_from_any_position():
+    """Test PARTIAL is found wherever the missing descendants are."""
+    hierarchy_codes = ["E10", "E100", "E101", "E109"]
+
+    for codelist_codes in [["E10", "E109"], ["E10", "E100", "E101"]]:
+        result = acc.classify_code_descendants("E10", codelist_codes, hierarchy_codes)
+        assert result == "PARTIAL"
+
+
+def test_classify_code_descendants_code_outside_hierarchy():
+    """Test a code not in the hierarchy is classified by its descendants in it."""
+    hierarchy_codes = ["E10", "E100", "E101"]
+
+    assert acc.classify_code_descendants("E1", ["E100"], hierarchy_codes) == "PARTIAL"
+    assert (
+        acc.classify_code_descendants("E1", hierarchy_codes, hierarchy_codes)
+        == "COMPLETE"
+    )
+
+
+def test_classify_code_descendants_leaf():
+    """Test a code without descendants in the hierarchy is COMPLETE."""
+    result = acc.classify_code_descendants("E11", ["E11"], ["E10", "E100", "E11"])
+
+    assert result == "COMPLETE"
+
+
 def test_classify_code_descendants_four_char_always_complete():
     """Test that 4-character codes are always COMPLETE."""
-    codelist_codes = {"E119"}
-    hierarchy_codes = {"E119"}
+    codelist_codes = ["E119"]
+    hierarchy_codes = ["E119"]
 
     result = acc.classify_code_descendants("E119", codelist_codes, hierarchy_codes)
 
@@ -193,7 +251,7 @@ def test_analyze_codelist(mock_data_files):
     """Test analyzing a single codelist."""
     ocl_codes = common.load_ocl_codes()
     usage_data, _ = common.load_usage_data("apcs")
-    usage_codes = set(usage_data.keys())
+    non_ocl_usage_codes = sorted(set(usage_data) - ocl_codes["apcs"])
 
     # Codelist has E10 only
     codelist_codes = {"E10"}
@@ -201,11 +259,10 @@ def test_analyze_codelist(mock_data_files):
     result = acc.analyze_codelist(
         "/test/codelist/1/",
         codelist_codes,
-        ocl_codes["apcs"],
-        usage_codes,
+        non_ocl_usage_codes,
         usage_data,
         "Builder",
-        ocl_codes["ons_deaths"],
+        sorted(ocl_codes["ons_deaths"]),
         from_ehrql=True,
     )
 
@@ -219,11 +276,179 @@ def test_analyze_codelist(mock_data_files):
     # E100 and E101 are not in the codelist, so they won't be classified
     assert "E100" not in result["code_classifications"]
     assert "E101" not in result["code_classifications"]
+    assert result["code_statuses"] == result["code_classifications"]
+
+
+def test_analyze_codelist_statuses_for_codes_outside_hierarchy(mock_data_files):
+    """Test codes missing from the hierarchy get a status but no classification."""
+    ocl_codes = common.load_ocl_codes()
+    hierarchy = sorted(ocl_codes["ons_deaths"])
+
+    result = acc.analyze_codelist(
+        "/test/codelist/1/",
+        {"E1", "E100"},
+        [],
+        {},
+        "Uploaded",
+        hierarchy,
+    )
+
+    assert result["code_classifications"] == {"E100": "COMPLETE"}
+    assert result["code_statuses"] == {"E1": "PARTIAL", "E100": "COMPLETE"}
+
+
+def test_analyze_codelist_usage():
+    """Test usage is totalled for codelist codes and missing descendants."""
+    key = ("apcs_primary_count", "2024-25")
+    usage_data = {"E10": {key: 5}, "E100": {key: 10}, "E10X": {key: 7}, "M60": {}}
+
+    result = acc.analyze_codelist(
+        "/test/codelist/1/",
+        {"E10", "E100", "E11"},
+        ["E10X", "M60"],
+        usage_data,
+        "Builder",
+        ["E10", "E100", "E11"],
+    )
+
+    assert result["actual_usage"] == {key: 15}
+    # E10X is used but isn't an OCL code
+    assert result["missing_descendants"] == ["E10X"]
+    assert result["potential_usage"] == {key: 7}
+    assert "E11" not in usage_data
+
+
+def test_analyze_codelist_nested_missing_descendants():
+    """Test missing descendants under nested codelist codes are only found once."""
+    non_ocl_usage_codes = ["E10X", "E10XX", "E11X", "F00X"]
+
+    result = acc.analyze_codelist(
+        "/test/codelist/1/",
+        {"E1", "E10", "E10X", "F0"},
+        non_ocl_usage_codes,
+        {},
+        "Builder",
+        ["E10", "E11"],
+    )
+
+    assert result["missing_descendants"] == ["E10X", "E10XX", "E11X", "F00X"]
+
+
+def test_analyze_codelist_reuses_code_statuses(monkeypatch):
+    """Test statuses passed in are used rather than classifying again."""
+
+    def fail(*args):
+        raise AssertionError("classified again")
+
+    monkeypatch.setattr(acc, "classify_code_descendants", fail)
+
+    result = acc.analyze_codelist(
+        "/test/codelist/1/",
+        {"E1", "E10"},
+        [],
+        {},
+        "Builder",
+        ["E10", "E100"],
+        code_statuses={"E1": "PARTIAL", "E10": "NONE"},
+    )
+
+    assert result["code_statuses"] == {"E1": "PARTIAL", "E10": "NONE"}
+    # Only codes in the hierarchy are classified
+    assert result["code_classifications"] == {"E10": "NONE"}
+
+
+def test_analyze_named_codelist(mock_data_files, monkeypatch):
+    """Test a worker loads and analyzes a named codelist from the shared data."""
+    monkeypatch.setattr(acc, "_worker_data", {})
+    ocl_codes = common.load_ocl_codes()
+    usage_data, _ = common.load_usage_data("apcs")
+    rsi_map = {"/test/codelist/1/": {"creation_method": "Builder"}}
+
+    acc._init_worker(
+        sorted(set(usage_data) - ocl_codes["apcs"]),
+        usage_data,
+        sorted(ocl_codes["ons_deaths"]),
+        rsi_map,
+        {"/test/codelist/1/"},
+        {},
+    )
+    result = acc._analyze_named_codelist("/test/codelist/1/")
+
+    assert result["codelist_codes"] == {"E10"}
+    assert result["creation_method"] == "Builder"
+    assert result["from_ehrql"] is True
+    assert result["code_classifications"] == {"E10": "NONE"}
+
+
+def test_analyze_named_codelist_reuses_analysis(mock_data_files, monkeypatch):
+    """Test codelists with the same codes reuse the analysis of the first."""
+    monkeypatch.setattr(acc, "_worker_data", {})
+    (mock_data_files["cache_dir"] / "test_codelist_2.csv").write_text(
+        "code,term\nE10,Diabetes\n"
+    )
+    ocl_codes = common.load_ocl_codes()
+    rsi_map = {"/test/codelist/2/": {"creation_method": "Uploaded"}}
+    acc._init_worker([], {}, sorted(ocl_codes["ons_deaths"]), rsi_map, set(), {})
+    calls = []
+    analyze_codelist = acc.analyze_codelist
+    monkeypatch.setattr(
+        acc,
+        "analyze_codelist",
+        lambda *args: calls.append(args[0]) or analyze_codelist(*args),
+    )
+
+    first = acc._analyze_named_codelist("/test/codelist/1/")
+    second = acc._analyze_named_codelist("/test/codelist/2/")
+
+    assert calls == ["/test/codelist/1/"]
+    assert second["codelist_id"] == "/test/codelist/2/"
+    assert second["creation_method"] == "Uploaded"
+    assert first["creation_method"] is None
+    assert second["code_classifications"] == first["code_classifications"]
+
+
+def test_analyze_named_codelist_keeps_recent_results(mock_data_files, monkeypatch):
+    """Test each worker only keeps a bounded number of results for reuse."""
+    monkeypatch.setattr(acc, "_worker_data", {})
+    monkeypatch.setattr(acc, "MAX_CACHED_RESULTS", 1)
+    (mock_data_files["cache_dir"] / "test_codelist_3.csv").write_text(
+        "code,term\nE11,Type 2 diabetes\n"
+    )
+    ocl_codes = common.load_ocl_codes()
+    acc._init_worker([], {}, sorted(ocl_codes["ons_deaths"]), {}, set(), {})
+    calls = []
+    analyze_codelist = acc.analyze_codelist
+    monkeypatch.setattr(
+        acc,
+        "analyze_codelist",
+        lambda *args: calls.append(args[0]) or analyze_codelist(*args),
+    )
+
+    for codelist_id in ["/test/codelist/1/", "/test/codelist/3/", "/test/codelist/1/"]:
+        acc._analyze_named_codelist(codelist_id)
+
+    assert calls == ["/test/codelist/1/", "/test/codelist/3/", "/test/codelist/1/"]
+    assert list(acc._worker_data["results_by_codes"]) == [frozenset({"E10"})]
+
+
+def test_get_usage_columns():
+    """Test usage columns are the data source's 2024-25 categories, sorted."""
+    usage_data = {
+        "E10": {("apcs_primary_count", "2024-25"): 1, ("ons_count", "2024-25"): 2},
+        "E11": {("apcs_all_count", "2024-25"): 3, ("apcs_old_count", "2023-24"): 4},
+        "E12": {("apcs_all_count", "2024-25"): 5},
+    }
+
+    assert acc.get_usage_columns(usage_data, "apcs") == [
+        "apcs_all_count",
+        "apcs_primary_count",
+    ]
+    assert acc.get_usage_columns(usage_data, "ons_deaths") == ["ons_count"]
+    assert acc.get_usage_columns({}, "apcs") == []
 
 
 def test_write_csv_report(mock_data_files, tmp_path):
     """Test writing CSV report."""
-    ocl_codes = common.load_ocl_codes()
     usage_data, raw_usage = common.load_usage_data("apcs")
 
     results = [
@@ -234,6 +459,7 @@ def test_write_csv_report(mock_data_files, tmp_path):
             "total_codes": 2,
             "codelist_codes": {"E10", "E100"},
             "code_classifications": {"E10": "PARTIAL", "E100": "EXTRA"},
+            "code_statuses": {"E10": "PARTIAL", "E100": "EXTRA"},
             "actual_usage": {},
             "missing_descendants": [],
             "potential_usage": {},
@@ -248,7 +474,6 @@ def test_write_csv_report(mock_data_files, tmp_path):
         raw_usage,
         output_file,
         "apcs",
-        ocl_codes["ons_deaths"],
     )
 
     assert output_file.exists()
@@ -261,6 +486,129 @@ def test_write_csv_report(mock_data_files, tmp_path):
         assert any(row["icd10_code"] == "E10" for row in rows)
         assert any(row["icd10_code"] == "E100" for row in rows)
 
+    # Usage columns hold the raw 2024-25 values, or blank if there's no usage
+    by_code = {row["icd10_code"]: row for row in rows}
+    assert by_code["E10"]["apcs_primary_count"] == ""
+    assert by_code["E100"]["apcs_primary_count"] == "100"
+    assert by_code["E101"]["status"] == "EXTRA"
+    assert by_code["E101"]["apcs_all_count"] == "120"
+
+
+def test_write_csv_report_extra_rows(mock_data_files, tmp_path):
+    """Test usage descendants of classified codes are written as EXTRA rows."""
+    usage_data, raw_usage = common.load_usage_data("apcs")
+
+    def result(codelist_id, creation_method):
+        statuses = {"E10": "NONE", "M60": "COMPLETE", "M601": "COMPLETE"}
+        return {
+            "codelist_id": codelist_id,
+            "creation_method": creation_method,
+            "from_ehrql": False,
+            "codelist_codes": set(statuses),
+            "code_classifications": statuses,
+            "code_statuses": statuses,
+        }
+
+    output_file = tmp_path / "test_coverage.csv"
+    acc.write_csv_report(
+        [result("/builder/", "Builder"), result("/uploaded/", "Uploaded")],
+        usage_data,
+        raw_usage,
+        output_file,
+        "apcs",
+    )
+
+    with open(output_file) as f:
+        rows = [
+            (row["codelist_id"], row["icd10_code"], row["status"])
+            for row in csv.DictReader(f)
+        ]
+
+    assert rows == [
+        ("/builder/", "E10", "NONE"),
+        ("/builder/", "M60", "COMPLETE"),
+        ("/builder/", "M600", "EXTRA"),
+        ("/builder/", "M601", "COMPLETE"),
+        # Descendants of NONE codes are only included for uploaded codelists
+        ("/uploaded/", "E10", "NONE"),
+        ("/uploaded/", "E100", "EXTRA"),
+        ("/uploaded/", "E101", "EXTRA"),
+        ("/uploaded/", "M60", "COMPLETE"),
+        ("/uploaded/", "M600", "EXTRA"),
+        ("/uploaded/", "M601", "COMPLETE"),
+    ]
+
+
+def test_write_csv_report_nested_parents(tmp_path):
+    """Test EXTRA codes under nested parents are written once, in code order."""
+    key = ("apcs_primary_count", "2024-25")
+    usage_data = {code: {key: 1} for code in ["E10", "E100", "E101", "E11X", "F00"]}
+    raw_usage = {code: {key: "1"} for code in usage_data}
+    statuses = {"E1": "COMPLETE", "E10": "PARTIAL", "E101": "COMPLETE"}
+    results = [
+        {
+            "codelist_id": "/nested/",
+            "creation_method": "Builder",
+            "from_ehrql": False,
+            "codelist_codes": frozenset(statuses),
+            "code_classifications": statuses,
+            "code_statuses": statuses,
+        }
+    ]
+
+    output_file = tmp_path / "test_coverage.csv"
+    acc.write_csv_report(results, usage_data, raw_usage, output_file, "apcs")
+
+    with open(output_file) as f:
+        rows = [(row["icd10_code"], row["status"]) for row in csv.DictReader(f)]
+
+    assert rows == [
+        ("E1", "COMPLETE"),
+        ("E10", "PARTIAL"),
+        ("E100", "EXTRA"),
+        ("E101", "COMPLETE"),
+        ("E11X", "EXTRA"),
+    ]
+
+
+def test_report_order():
+    """Test ehrQL codelists sort before the rest, then by codelist ID."""
+    results = [
+        {"codelist_id": "/a/", "from_ehrql": False},
+        {"codelist_id": "<inline>:1", "from_ehrql": True},
+        {"codelist_id": "/b/", "from_ehrql": True},
+    ]
+
+    assert [r["codelist_id"] for r in sorted(results, key=acc.report_order)] == [
+        "/b/",
+        "<inline>:1",
+        "/a/",
+    ]
+
+
+def test_write_csv_report_streams_results(mock_data_files, tmp_path):
+    """Test results can be streamed in, and are written in the order given."""
+
+    def results():
+        for codelist_id in ["/first/", "/second/"]:
+            yield {
+                "codelist_id": codelist_id,
+                "creation_method": "Builder",
+                "from_ehrql": False,
+                "codelist_codes": frozenset({"I10"}),
+                "code_classifications": {},
+                "code_statuses": {"I10": "COMPLETE"},
+            }
+
+    output_file = tmp_path / "test_coverage.csv"
+    acc.write_csv_report(results(), {}, {}, output_file, "apcs")
+
+    with open(output_file) as f:
+        assert [row["codelist_id"] for row in csv.DictReader(f)] == [
+            "/first/",
+            "/second/",
+        ]
+
 
 def test_format_number():
     """Test formatting numbers with thousands separator."""
@@ -67,6 +67,8 @@ def test_parse_count():
     assert apm.parse_count("<15") == 0
     assert apm.parse_count("") == 0
     assert apm.parse_count("0") == 0
+    # Counts come from the input, so the cache must be bounded
+    assert apm.parse_count.cache_info().maxsize is not None
 
 
 def test_is_descendant():
@@ -78,6 +80,12 @@ def test_is_descendant():
     assert apm.is_descendant("E1", "E10") is False
 
 
+def test_get_ancestor_codes():
+    """Test getting the codes that could be ancestors of a code."""
+    assert apm.get_ancestor_codes("E1001") == ("E", "E1", "E10", "E100")
+    assert apm.get_ancestor_codes("E") == ()
+
+
 def test_get_codelist_codes(mock_prefix_matching_data):
     """Test getting all rows for a specific codelist."""
     data, _ = common.get_apcs_coverage_data()
@@ -90,12 +98,33 @@ def test_get_codelist_codes(mock_prefix_matching_data):
     assert any(r["icd10_code"] == "E100" for r in rows)
 
 
+def test_split_codelist():
+    """Test splitting a codelist's rows into codelist codes and EXTRA codes."""
+    rows = [
+        {"icd10_code": "E10", "status": "COMPLETE"},
+        {"icd10_code": "E100", "status": "EXTRA"},
+        {"icd10_code": "E11", "status": "PARTIAL"},
+        {"icd10_code": "E12", "status": "NONE"},
+        {"icd10_code": "E13", "status": "UNKNOWN"},
+    ]
+
+    codelist = apm.split_codelist(rows)
+
+    assert [r["icd10_code"] for r in codelist["codes"]] == ["E10", "E11", "E12"]
+    assert [
+        (r["icd10_code"], ancestor_codes) for r, ancestor_codes in codelist["extras"]
+    ] == [("E100", ("E", "E1", "E10"))]
+    assert codelist["complete"] == {"E10"}
+    assert codelist["partial"] == {"E11"}
+    assert codelist["none"] == {"E12"}
+
+
 def test_analyze_primary_secondary(mock_prefix_matching_data):
     """Test analyzing primary and secondary counts."""
     data, _ = common.get_apcs_coverage_data()
     codelist_rows = [r for r in data if r["codelist_id"] == "/test/codelist/1/"]
 
-    result = apm.analyze_primary_secondary(codelist_rows)
+    result = apm.analyze_primary_secondary(apm.split_codelist(codelist_rows))
 
     assert "baseline_primary" in result
     assert "strict_primary" in result
@@ -117,7 +146,7 @@ def test_analyze_none_uploaded(mock_prefix_matching_data):
     data, _ = common.get_apcs_coverage_data()
     codelist_rows = [r for r in data if r["codelist_id"] == "/test/codelist/2/"]
 
-    result = apm.analyze_none_uploaded(codelist_rows)
+    result = apm.analyze_none_uploaded(apm.split_codelist(codelist_rows))
 
     assert "none_primary" in result
     assert "none_secondary" in result
@@ -132,7 +161,7 @@ def test_analyze_all_count(mock_prefix_matching_data):
     data, _ = common.get_apcs_coverage_data()
     codelist_rows = [r for r in data if r["codelist_id"] == "/test/codelist/1/"]
 
-    result = apm.analyze_all_count(codelist_rows)
+    result = apm.analyze_all_count(apm.split_codelist(codelist_rows))
 
     assert "baseline_all" in result
     assert "with_partial_children_all" in result
@@ -141,6 +170,60 @@ def test_analyze_all_count(mock_prefix_matching_data):
     assert result["baseline_all"] == 150
 
 
+def test_summarize():
+    """Test totals and unaffected counts are collected from the results."""
+    unaffected = dict.fromkeys(apm.SUMMARY_FIELDS, 10)
+    affected = {**unaffected, "strict_primary": 15, "with_partial_children_all": 12}
+
+    summary = apm.summarize([unaffected, affected])
+
+    assert summary["count"] == 2
+    assert summary["totals"]["baseline_primary"] == 20
+    assert summary["totals"]["strict_primary"] == 25
+    assert summary["totals"]["with_partial_children_all"] == 22
+    assert summary["unaffected"]["strict_primary"] == 1
+    assert summary["unaffected"]["partial_primary"] == 2
+    assert summary["unaffected"]["with_partial_children_all"] == 1
+
+
+def test_analyze_codelist_without_extra_codes():
+    """Test every scenario is the baseline when a codelist has no EXTRA codes."""
+    rows = [
+        {
+            "icd10_code": "E10",
+            "status": "PARTIAL",
+            "apcs_primary_count": "100",
+            "apcs_secondary_count": "<15",
+            "apcs_all_count": "150",
+        },
+        {
+            "icd10_code": "E11",
+            "status": "NONE",
+            "apcs_primary_count": "20",
+            "apcs_secondary_count": "30",
+            "apcs_all_count": "",
+        },
+    ]
+    codelist = apm.split_codelist(rows)
+
+    assert apm.analyze_primary_secondary(codelist) == {
+        "baseline_primary": 120,
+        "baseline_secondary": 30,
+        "strict_primary": 120,
+        "strict_secondary": 30,
+        "partial_primary": 120,
+        "partial_secondary": 30,
+    }
+    assert apm.analyze_none_uploaded(codelist) == {
+        "none_primary": 0,
+        "none_secondary": 0,
+    }
+    assert apm.analyze_all_count(codelist) == {
+        "baseline_all": 150,
+        "with_partial_children_all": 150,
+    }
+
+
 def test_run_analysis_creates_output_files(mock_prefix_matching_data):
     """Test that run_analysis creates expected output files."""
     results = apm.run_analysis()
@@ -161,6 +244,24 @@ def test_run_analysis_creates_output_files(mock_prefix_matching_data):
         assert "baseline_primary" in reader.fieldnames
 
 
+def test_write_markdown_report_keeps_old_report_on_error(
+    mock_prefix_matching_data, monkeypatch
+):
+    """Test a failure while building the report leaves the old report alone."""
+    results = apm.run_analysis()
+    md_file = mock_prefix_matching_data["out_dir"] / "prefix_matching_analysis.md"
+    old_report = md_file.read_text()
+
+    def fail(*args):
+        raise RuntimeError("table failed")
+
+    monkeypatch.setattr(apm, "write_all_table", fail)
+    with pytest.raises(RuntimeError, match="table failed"):
+        apm.write_markdown_report(results)
+
+    assert md_file.read_text() == old_report
+
+
 def test_load_prefix_matching_results(mock_prefix_matching_data):
     """Test loading prefix matching results."""
     # First run analysis to create the CSV
@@ -180,6 +281,7 @@ def test_load_prefix_matching_results(mock_prefix_matching_data):
         assert "baseline_primary" in disc
         assert "with_x_padding" in disc
         assert "with_prefix_matching" in disc
+        assert "percentage_increase" in disc
 
 
 def test_map_to_repos_creates_output(mock_prefix_matching_data):
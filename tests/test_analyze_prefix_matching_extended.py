@@ -91,7 +91,7 @@ def test_analyze_primary_secondary_3char_complete(mock_extended_data):
     data, _ = common.get_apcs_coverage_data()
     codelist_rows = [r for r in data if r["codelist_id"] == "/test/3char/"]
 
-    result = apm.analyze_primary_secondary(codelist_rows)
+    result = apm.analyze_primary_secondary(apm.split_codelist(codelist_rows))
 
     # Baseline: just E10
     assert result["baseline_primary"] == 1000
@@ -106,7 +106,7 @@ def test_analyze_primary_secondary_4char_complete(mock_extended_data):
     data, _ = common.get_apcs_coverage_data()
     codelist_rows = [r for r in data if r["codelist_id"] == "/test/4char/"]
 
-    result = apm.analyze_primary_secondary(codelist_rows)
+    result = apm.analyze_primary_secondary(apm.split_codelist(codelist_rows))
 
     # Baseline: just E100
     assert result["baseline_primary"] == 800
@@ -120,7 +120,7 @@ def test_analyze_primary_secondary_partial_3char(mock_extended_data):
     data, _ = common.get_apcs_coverage_data()
     codelist_rows = [r for r in data if r["codelist_id"] == "/test/partial/"]
 
-    result = apm.analyze_primary_secondary(codelist_rows)
+    result = apm.analyze_primary_secondary(apm.split_codelist(codelist_rows))
 
     # Baseline: M60
     assert result["baseline_primary"] == 500
@@ -135,7 +135,7 @@ def test_analyze_none_uploaded_with_descendants(mock_extended_data):
     data, _ = common.get_apcs_coverage_data()
     codelist_rows = [r for r in data if r["codelist_id"] == "/test/none/"]
 
-    result = apm.analyze_none_uploaded(codelist_rows)
+    result = apm.analyze_none_uploaded(apm.split_codelist(codelist_rows))
 
     # Should count descendants of NONE codes
     assert result["none_primary"] == 200 + 50
@@ -147,7 +147,7 @@ def test_analyze_none_uploaded_mixed_codelist(mock_extended_data):
     data, _ = common.get_apcs_coverage_data()
     codelist_rows = [r for r in data if r["codelist_id"] == "/test/mixed/"]
 
-    result = apm.analyze_none_uploaded(codelist_rows)
+    result = apm.analyze_none_uploaded(apm.split_codelist(codelist_rows))
 
     # Should only count descendants of I30 (NONE)
     assert result["none_primary"] == 100
@@ -159,7 +159,7 @@ def test_analyze_all_count_with_partial_children(mock_extended_data):
     data, _ = common.get_apcs_coverage_data()
     codelist_rows = [r for r in data if r["codelist_id"] == "/test/partial/"]
 
-    result = apm.analyze_all_count(codelist_rows)
+    result = apm.analyze_all_count(apm.split_codelist(codelist_rows))
 
     # Baseline: M60
     assert result["baseline_all"] == 750
@@ -1,6 +1,7 @@
 """Tests for reporting/common.py module."""
 
 import json
+import pickle
 
 import pytest
 
@@ -50,7 +51,7 @@ def test_load_ocl_codes_creates_x_padded_codes(tmp_data_dir):
     # Create a minimal OCL file with a 3-char code that has no children
     ocl_file = tmp_data_dir / "ocl_icd10_codes.txt"
     ocl_file.write_text(
-        "A00\nA01\nA02\nA03\nB99\nC341\nD50\nE119\nI10\nJ459\nZ992\n"
+        "A00\nA01\nA02\nA03\nB99\nC341\nD50\nE11\nE119\nI10\nJ459\nZ992\n"
         + "\n".join(f"X{i:03d}" for i in range(1000, 13000))
     )
 
@@ -60,6 +61,70 @@ def test_load_ocl_codes_creates_x_padded_codes(tmp_data_dir):
     # Check if D50X is in apcs but D50 is also there
     assert "D50" in result["ons_deaths"]
     # D50X should be in APCS if D50 has no children
+    assert "D50X" in result["apcs"]
+    assert "D50" not in result["apcs"]
+    # E11 has a child (E119), so isn't padded
+    assert "E11X" not in result["apcs"]
+    assert "E119" in result["apcs"]
+
+
+def test_load_json_with_cache(tmp_path):
+    """Test JSON is cached as a pickle that is ignored once the file changes."""
+    json_file = tmp_path / "data.json"
+    json_file.write_text(json.dumps({"codelists": ["a"]}))
+
+    assert common.load_json_with_cache(json_file) == {"codelists": ["a"]}
+    (cache_file,) = (tmp_path / ".cache").iterdir()
+    assert pickle.loads(cache_file.read_bytes()) == {"codelists": ["a"]}
+
+    # A second load reads the pickle
+    cache_file.write_bytes(pickle.dumps({"codelists": ["from cache"]}))
+    assert common.load_json_with_cache(json_file) == {"codelists": ["from cache"]}
+
+    # Changing the file means it is parsed again, replacing the old pickle
+    json_file.write_text(json.dumps({"codelists": ["a", "b"]}))
+    assert common.load_json_with_cache(json_file) == {"codelists": ["a", "b"]}
+    (new_cache_file,) = (tmp_path / ".cache").iterdir()
+    assert new_cache_file != cache_file
+
+
+def test_load_json_with_cache_ignores_bad_pickle(tmp_path):
+    """Test an unreadable pickle is replaced by parsing the JSON again."""
+    json_file = tmp_path / "data.json"
+    json_file.write_text(json.dumps({"codelists": ["a"]}))
+    common.load_json_with_cache(json_file)
+    (cache_file,) = (tmp_path / ".cache").iterdir()
+
+    # Refers to a module that doesn't exist, so unpickling raises ImportError
+    cache_file.write_bytes(b"\x80\x04cno_such_module\nthing\n.")
+    assert common.load_json_with_cache(json_file) == {"codelists": ["a"]}
+    assert pickle.loads(cache_file.read_bytes()) == {"codelists": ["a"]}
+
+    # Truncated
+    cache_file.write_bytes(cache_file.read_bytes()[:5])
+    assert common.load_json_with_cache(json_file) == {"codelists": ["a"]}
+    assert pickle.loads(cache_file.read_bytes()) == {"codelists": ["a"]}
+
+
+def test_find_rsi_metadata():
+    """Test codelists are found by full slug, then by hash."""
+    by_slug = {"coding_system": "icd10", "creation_method": "Builder"}
+    by_hash = {"coding_system": "icd10", "creation_method": "Uploaded"}
+    rsi_map = {"/opensafely/asthma/2020-01-01/": by_slug, "abc123": by_hash}
+
+    assert (
+        common.find_rsi_metadata("/opensafely/asthma/2020-01-01/", rsi_map) is by_slug
+    )
+    assert common.find_rsi_metadata("/user/someone/asthma/abc123/", rsi_map) is by_hash
+    assert common.find_rsi_metadata("/opensafely/copd/2020-01-01/", rsi_map) is None
+
+
+def test_is_icd10_code():
+    """Test ICD-10 code format checks."""
+    for code in ["E10", "E110", "E1101", "E10X", "M907", "S92X", "S92X0"]:
+        assert common.is_icd10_code(code)
+    for code in ["", "E1", "e10", "E10XX", "E11011", "EX10", "E10 "]:
+        assert not common.is_icd10_code(code)
 
 
 def test_parse_value():
@@ -147,6 +212,96 @@ def test_load_usage_data_apcs(tmp_path, monkeypatch):
     assert raw_usage["E11"][("apcs_primary_count", "2024-25")] == "<15"
 
 
+def test_load_usage_data_totals(tmp_path, monkeypatch):
+    """Test usage is totalled across financial years for each column."""
+    usage_file = tmp_path / "code_usage_combined_apcs.csv"
+    usage_file.write_text(
+        "icd10_code,financial_year,apcs_primary_count,apcs_secondary_count,apcs_all_count,in_opencodelists\n"
+        "E10,2023-24,100,50,150,yes\n"
+        "E10,2024-25,<15,20,30,yes\n"
+        ",2024-25,1,1,1,no\n"
+    )
+    monkeypatch.setattr(common, "USAGE_FILE_APCS", usage_file)
+
+    usage, raw_usage = common.load_usage_data("apcs")
+
+    assert list(usage) == ["E10"]
+    assert usage["E10"][("apcs_primary_count", "TOTAL")] == 100
+    assert usage["E10"][("apcs_secondary_count", "TOTAL")] == 70
+    assert usage["E10"][("apcs_all_count", "TOTAL")] == 180
+    assert ("apcs_all_count", "TOTAL") not in raw_usage["E10"]
+
+    # The usage data is sent to worker processes, so must be picklable
+    assert pickle.loads(pickle.dumps(usage)) == usage
+    assert pickle.loads(pickle.dumps(raw_usage)) == raw_usage
+
+
+def test_load_usage_data_empty_file(tmp_path, monkeypatch):
+    """Test an empty usage file has no usage."""
+    usage_file = tmp_path / "code_usage_combined_apcs.csv"
+    usage_file.write_text("")
+    monkeypatch.setattr(common, "USAGE_FILE_APCS", usage_file)
+
+    assert common.load_usage_data("apcs") == ({}, {})
+
+
+def test_load_usage_data_skips_blank_lines(tmp_path, monkeypatch):
+    """Test blank lines in the usage file are skipped."""
+    usage_file = tmp_path / "code_usage_combined_apcs.csv"
+    usage_file.write_text(
+        "icd10_code,financial_year,apcs_primary_count,apcs_secondary_count,apcs_all_count,in_opencodelists\n"
+        "\n"
+        "E10,2024-25,100,50,150,yes\n"
+        "\n"
+    )
+    monkeypatch.setattr(common, "USAGE_FILE_APCS", usage_file)
+
+    usage, _ = common.load_usage_data("apcs")
+
+    assert list(usage) == ["E10"]
+    assert usage["E10"][("apcs_primary_count", "2024-25")] == 100
+
+
+def test_load_usage_data_raw_usage_year(tmp_path, monkeypatch):
+    """Test raw values can be limited to a single financial year."""
+    usage_file = tmp_path / "code_usage_combined_ons_deaths.csv"
+    usage_file.write_text(
+        "icd10_code,financial_year,ons_primary_count,ons_contributing_count,in_opencodelists\n"
+        "I21,2023-24,<15,300,yes\n"
+        "I21,2024-25,500,<15,yes\n"
+        "I22,2023-24,10,10,yes\n"
+    )
+    monkeypatch.setattr(common, "USAGE_FILE_ONS_DEATHS", usage_file)
+
+    usage, raw_usage = common.load_usage_data("ons_deaths", raw_usage_year="2024-25")
+
+    assert raw_usage == {
+        "I21": {
+            ("ons_primary_count", "2024-25"): "500",
+            ("ons_contributing_count", "2024-25"): "<15",
+        }
+    }
+    # Processed usage still covers every year
+    assert usage["I21"][("ons_contributing_count", "TOTAL")] == 300
+    assert usage["I22"][("ons_primary_count", "2023-24")] == 10
+
+
+def test_load_usage_data_missing_column(tmp_path, monkeypatch):
+    """Test columns missing from the usage file count as blank."""
+    usage_file = tmp_path / "code_usage_combined_ons_deaths.csv"
+    # Columns in a different order, and no ons_contributing_count
+    usage_file.write_text(
+        "financial_year,icd10_code,ons_primary_count\n2024-25,I21,500\n"
+    )
+    monkeypatch.setattr(common, "USAGE_FILE_ONS_DEATHS", usage_file)
+
+    usage, raw_usage = common.load_usage_data("ons_deaths")
+
+    assert usage["I21"][("ons_primary_count", "2024-25")] == 500
+    assert usage["I21"][("ons_contributing_count", "2024-25")] == 0
+    assert raw_usage["I21"][("ons_contributing_count", "2024-25")] == ""
+
+
 def test_load_usage_data_ons_deaths(tmp_path, monkeypatch):
     """Test loading ONS deaths usage data."""
     out_dir = tmp_path / "outputs"
@@ -167,6 +322,20 @@ def test_load_usage_data_ons_deaths(tmp_path, monkeypatch):
     assert usage["I21"][("ons_contributing_count", "2024-25")] == 300
 
 
+def test_download_missing_codelists(tmp_path, monkeypatch):
+    """Test only codelists missing from the cache are downloaded."""
+    monkeypatch.setattr(common, "CACHE_DIR", tmp_path)
+    (tmp_path / "cached_codelist_1.csv").write_text("code\nE10\n")
+    downloaded = []
+    monkeypatch.setattr(common, "download_codelist", downloaded.append)
+
+    common.download_missing_codelists(
+        ["/cached/codelist/1/", "/new/codelist/1/", "/new/codelist/2/"]
+    )
+
+    assert sorted(downloaded) == ["/new/codelist/1/", "/new/codelist/2/"]
+
+
 def test_load_codelist_without_expansion(tmp_data_dir, monkeypatch):
     """Test loading codelist without expansion."""
     cache_dir = tmp_data_dir / "codelist_cache"
@@ -187,6 +356,34 @@ def test_load_codelist_without_expansion(tmp_data_dir, monkeypatch):
     assert result == {"E10", "E11"}
 
 
+def test_load_codelist_interns_codes(tmp_path, monkeypatch):
+    """Test codes shared between codelists are the same string objects."""
+    for name in ["first", "second"]:
+        (tmp_path / f"test_{name}.csv").write_text("code\nE10\n")
+    monkeypatch.setattr(common, "CACHE_DIR", tmp_path)
+
+    (first,) = common.load_codelist("/test/first/")
+    (second,) = common.load_codelist("/test/second/")
+
+    assert first is second
+
+
+def test_load_icd10_codelists_inline_codes(monkeypatch):
+    """Test inline ICD-10 codelists have their codes as a frozenset."""
+    monkeypatch.setattr(
+        common,
+        "extract_codelist_ids",
+        lambda: ([], [("E10", "E11"), ("E10", "not-icd10")]),
+    )
+
+    codelist_ids, inline_codelists = common.load_icd10_codelists({})
+
+    assert codelist_ids == []
+    (inline,) = inline_codelists
+    assert inline["codes"] == frozenset({"E10", "E11"})
+    assert inline["codes_str"] == "E10|E11"
+
+
 def test_get_apcs_coverage_data(tmp_path, monkeypatch):
     """Test getting APCS coverage data."""
     # Clear global cache
@@ -219,6 +416,53 @@ def test_get_apcs_coverage_data(tmp_path, monkeypatch):
     assert "E11" in codelist_codes["/test/codelist/1/"]
 
 
+def test_get_apcs_coverage_data_interns_values(tmp_path, monkeypatch):
+    """Test repeated values in the coverage data are the same string objects."""
+    monkeypatch.setattr(common, "_coverage_data", [])
+    monkeypatch.setattr(common, "_codelist_codes", {})
+    coverage_file = tmp_path / "codelist_coverage_detail_apcs.csv"
+    coverage_file.write_text(
+        "codelist_id,creation_method,Exists in ehrQL repo,icd10_code,status\n"
+        "/test/codelist/1/,Builder,Y,E10,COMPLETE\n"
+        "/test/codelist/2/,Builder,Y,E10,COMPLETE\n"
+    )
+    monkeypatch.setattr(common, "COVERAGE_APCS_FILE", coverage_file)
+
+    (first, second), _ = common.get_apcs_coverage_data()
+
+    for key in ["creation_method", "icd10_code", "status"]:
+        assert first[key] is second[key]
+
+
+def test_get_apcs_coverage_data_only_ehrql_rows(tmp_path, monkeypatch):
+    """Test only rows for codelists in ehrQL repos are loaded, as dicts."""
+    monkeypatch.setattr(common, "_coverage_data", [])
+    monkeypatch.setattr(common, "_codelist_codes", {})
+    coverage_file = tmp_path / "codelist_coverage_detail_apcs.csv"
+    coverage_file.write_text(
+        "codelist_id,creation_method,Exists in ehrQL repo,icd10_code,status\n"
+        "/test/codelist/1/,Builder,Y,E10,COMPLETE\n"
+        "/test/codelist/2/,Builder,N,E11,COMPLETE\n"
+        "\n"
+        "/test/codelist/1/,Builder,Y,E100,EXTRA\n"
+    )
+    monkeypatch.setattr(common, "COVERAGE_APCS_FILE", coverage_file)
+
+    data, codelist_codes = common.get_apcs_coverage_data()
+
+    assert data == [
+        {
+            "codelist_id": "/test/codelist/1/",
+            "creation_method": "Builder",
+            "Exists in ehrQL repo": "Y",
+            "icd10_code": code,
+            "status": status,
+        }
+        for code, status in [("E10", "COMPLETE"), ("E100", "EXTRA")]
+    ]
+    assert codelist_codes == {"/test/codelist/1/": ["E10"]}
+
+
 def test_load_rsi_codelists(tmp_path, monkeypatch):
     """Test loading RSI codelist metadata."""
     data_dir = tmp_path / "data"
@@ -277,3 +521,22 @@ def test_load_ehrql_codelists_to_repos(tmp_path, monkeypatch):
     assert "/user/test/codelist/abc123/" in result
     assert "opensafely/test-repo" in result["/user/test/codelist/abc123/"]
     assert "opensafely/test-repo" in result["/user/test/codelist/abc123/"]
+
+
+def test_load_ehrql_codelists_to_repos_skips_unused_files(tmp_path, monkeypatch):
+    """Test codelists only in files that no repo uses are left out."""
+    monkeypatch.setattr(common, "_ehrql_data", {})
+    ehrql_file = tmp_path / "ehrql_codelists.json"
+    ehrql_data = {
+        "projects": {"opensafely/test-repo": {"main": "hash123", "old": "hash123"}},
+        "signatures": {
+            "hash123": {"codelists.py": {"used": [["/user/test/used/"], []]}},
+            "hash456": {"codelists.py": {"unused": [["/user/test/unused/"]]}},
+        },
+    }
+    ehrql_file.write_text(json.dumps(ehrql_data))
+    monkeypatch.setattr(common, "EHRQL_JSON_FILE", ehrql_file)
+
+    result = common.load_ehrql_codelists_to_repos()
+
+    assert result == {"/user/test/used/": {"opensafely/test-repo"}}
@@ -0,0 +1,375 @@
+"""Tests for analysis/validate_output.py module."""
+
+import csv
+
+import pytest
+
+from analysis import validate_output as vo
+
+
+APCS_HEADER = "financial_year,icd10_code,primary_count,secondary_count,all_count\n"
+
+
+@pytest.fixture
+def output_dir(tmp_path, monkeypatch):
+    """Run in a temporary directory with an empty output/ folder."""
+    monkeypatch.chdir(tmp_path)
+    out = tmp_path / "output"
+    out.mkdir()
+    return out
+
+
+def read_rows(path):
+    with open(path, newline="") as f:
+        return list(csv.reader(f))
+
+
+def test_is_valid_icd10():
+    """Test the accepted ICD10 code shapes."""
+    for code in ["A00", "A00.0", "A00.X", "A000", "A00X", "A00.00", "A0000"]:
+        assert vo.is_valid_icd10(code)
+    for code in ["A00*", "A00|", "A000~", "a00", " A00 ", "", "NULL", None]:
+        assert vo.is_valid_icd10(code)
+    for code in ["A0", "AA00", "A00000", "A00.000", "A00-1", "A00XX"]:
+        assert not vo.is_valid_icd10(code)
+
+
+def test_is_valid_fy():
+    """Test only canonical YYYY-YY financial years (or blank/NULL) are valid."""
+    assert vo.is_valid_fy("2024-25")
+    assert vo.is_valid_fy("")
+    assert vo.is_valid_fy("NULL")
+    assert not vo.is_valid_fy("2024/25")
+    assert not vo.is_valid_fy("2024")
+
+
+def test_validators_remember_results():
+    """Test the result for each distinct value is remembered."""
+    assert vo.is_valid_icd10("Q99") is True
+    assert vo.is_valid_icd10("Q99?") is False
+    assert vo._icd10_validity["Q99"] is True
+    assert vo._icd10_validity["Q99?"] is False
+
+    assert vo.is_valid_fy("1999/00") is False
+    assert vo._fy_validity["1999/00"] is False
+
+
+def test_validators_stop_remembering_when_full(monkeypatch):
+    """Test the memos don't grow past their limits."""
+    monkeypatch.setattr(vo, "_icd10_validity", {})
+    monkeypatch.setattr(vo, "MAX_ICD10_VALIDITY_REMEMBERED", 1)
+    monkeypatch.setattr(vo, "_fy_slugs", {})
+    monkeypatch.setattr(vo, "MAX_FY_VALUES_REMEMBERED", 1)
+
+    assert vo.is_valid_icd10("A00") is True
+    assert vo.is_valid_icd10("A00?") is False
+    assert vo._icd10_validity == {"A00": True}
+
+    assert vo.slugify_fy("2024-25") == "2024_25"
+    assert vo.slugify_fy("2023-24") == "2023_24"
+    assert vo._fy_slugs == {"2024-25": "2024_25"}
+
+
+def test_slugify_fy():
+    """Test financial years are turned into file name slugs."""
+    assert vo.slugify_fy("2024-25") == "2024_25"
+    assert vo.slugify_fy(" 2024-25 ") == "2024_25"
+    assert vo.slugify_fy("2024/25") == "unknown"
+    assert vo.slugify_fy("") == "unknown"
+    assert vo.slugify_fy(None) == "unknown"
+    assert vo._fy_slugs["2024-25"] == "2024_25"
+
+
+def test_format_bullet_lists():
+    """Test bullet lists are sorted and start on a new line."""
+    assert vo.format_bullet_list(set()) == "None"
+    assert vo.format_bullet_list({"b", "a"}) == "\n    - a\n    - b"
+    assert vo.format_bullet_list({"a"}, more_rows=1234) == (
+        "\n    - a\n    - ... and 1,234 more rows"
+    )
+    assert vo.format_markdown_bullet_list([]) == "None"
+    assert vo.format_markdown_bullet_list(["b", "a"]) == "\n- `a`\n- `b`"
+
+
+def test_process_source_validates_file(output_dir):
+    """Test row counts, invalid financial years and file size."""
+    input_file = output_dir / "icd10_apcs.csv"
+    input_file.write_text(
+        APCS_HEADER + "2024-25,A00,10,20,30\n"
+        "2024/25,A01,10,20,30\n"
+        "NULL,A02,10,20,30\n"
+        "bad ,A03,10,20,30\n"
+    )
+
+    invalid_fy, other_fy, row_count, size, _, _ = vo.process_source(
+        str(input_file), "apcs"
+    )
+
+    assert invalid_fy == {"2024/25", "bad"}
+    assert other_fy == 0
+    assert row_count == 4
+    assert size == input_file.stat().st_size
+
+
+def test_process_source_caps_invalid_financial_years(output_dir, monkeypatch):
+    """Test only a limited number of distinct invalid FYs are kept."""
+    monkeypatch.setattr(vo, "MAX_INVALID_FY_REPORTED", 2)
+    input_file = output_dir / "icd10_apcs.csv"
+    input_file.write_text(
+        APCS_HEADER + "bad1,A00,10,20,30\n"
+        "bad2,A00,10,20,30\n"
+        "bad1,A00,10,20,30\n"
+        "bad3,A00,10,20,30\n"
+        "bad4,A00,10,20,30\n"
+    )
+
+    invalid_fy, other_fy, *_ = vo.process_source(str(input_file), "apcs")
+
+    assert invalid_fy == {"bad1", "bad2"}
+    assert other_fy == 2
+
+
+def test_process_source_missing_columns(output_dir):
+    """Test a file without the expected columns is rejected."""
+    input_file = output_dir / "icd10_apcs.csv"
+    input_file.write_text("financial_year,code,count\n2024-25,A00,10\n")
+
+    with pytest.raises(ValueError, match="missing columns: icd10_code"):
+        vo.process_source(str(input_file), "apcs")
+
+
+def test_process_source_missing_file(output_dir):
+    """Test a missing file reports zero rows and creates no files."""
+    assert vo.process_source("output/missing.csv", "apcs") == (set(), 0, 0, 0, [], [])
+    assert list(output_dir.iterdir()) == []
+
+
+def test_process_source_empty_file(output_dir):
+    """Test an empty file reports zero rows and creates no files."""
+    input_file = output_dir / "icd10_apcs.csv"
+    input_file.write_text("")
+
+    assert vo.process_source(str(input_file), "apcs") == (set(), 0, 0, 0, [], [])
+    assert list(output_dir.iterdir()) == [input_file]
+
+
+def test_process_source_ragged_rows(output_dir):
+    """Test missing fields in short rows are treated as blank."""
+    input_file = output_dir / "icd10_ons_deaths.csv"
+    input_file.write_text(
+        "financial_year,icd10_code,primary_cause_count,contributing_cause_count\n"
+        "2024-25,A00,10,20\n"
+        "2024-25,A01,10\n"
+        "2024-25\n"
+    )
+
+    _, _, row_count, _, fy_files, invalid_files = vo.process_source(
+        str(input_file), "ons_deaths"
+    )
+
+    assert row_count == 3
+    assert fy_files == [("output/icd10_ons_deaths_2024_25.csv", 3)]
+    assert invalid_files == []
+    assert read_rows(output_dir / "icd10_ons_deaths_2024_25.csv") == [
+        ["icd10_code", "primary_cause_count", "contributing_cause_count"],
+        ["A00", "10", "20"],
+        ["A01", "10", ""],
+        ["", "", ""],
+    ]
+
+
+def test_process_source_splits_by_financial_year(output_dir):
+    """Test rows are split per FY, dropping the financial_year column."""
+    input_file = output_dir / "icd10_apcs.csv"
+    input_file.write_text(
+        APCS_HEADER + "2024-25,A00,10,20,30\n"
+        "2024-25,A01,<15,0,20\n"
+        "2023-24,B99,10,10,10\n"
+        "2023-24,NOT_A_CODE,10,10,10\n"
+        " rubbish ,C34,10,10,10\n"
+    )
+
+    _, _, _, _, fy_files, _ = vo.process_source(str(input_file), "apcs")
+
+    assert sorted(fy_files) == [
+        ("output/icd10_apcs_2023_24.csv", 1),
+        ("output/icd10_apcs_2024_25.csv", 2),
+        ("output/icd10_apcs_unknown_financial_year.csv", 1),
+    ]
+    assert read_rows(output_dir / "icd10_apcs_2024_25.csv") == [
+        ["icd10_code", "primary_count", "secondary_count", "all_count"],
+        ["A00", "10", "20", "30"],
+        ["A01", "<15", "0", "20"],
+    ]
+    # Unknown financial years keep the (stripped) financial_year column
+    assert read_rows(output_dir / "icd10_apcs_unknown_financial_year.csv") == [
+        [
+            "financial_year",
+            "icd10_code",
+            "primary_count",
+            "secondary_count",
+            "all_count",
+        ],
+        ["rubbish", "C34", "10", "10", "10"],
+    ]
+
+
+def test_process_source_writes_invalid_rows(output_dir):
+    """Test only rows with invalid ICD10 codes are written, with all columns."""
+    input_file = output_dir / "icd10_ons_deaths.csv"
+    input_file.write_text(
+        "financial_year,icd10_code,primary_cause_count,contributing_cause_count\n"
+        "2024-25,A00,10,20\n"
+        '2024-25,"A0,1",10,20\n'
+        "2023-24,XYZ,<15,0\n"
+    )
+
+    _, _, _, _, fy_files, invalid_files = vo.process_source(
+        str(input_file), "ons_deaths"
+    )
+
+    assert fy_files == [("output/icd10_ons_deaths_2024_25.csv", 1)]
+    assert invalid_files == [("output/icd10_ons_deaths_invalid_rows.csv", 2)]
+    assert read_rows(output_dir / "icd10_ons_deaths_invalid_rows.csv") == [
+        [
+            "financial_year",
+            "icd10_code",
+            "primary_cause_count",
+            "contributing_cause_count",
+        ],
+        ["2024-25", "A0,1", "10", "20"],
+        ["2023-24", "XYZ", "<15", "0"],
+    ]
+
+
+def test_process_source_no_invalid_rows(output_dir):
+    """Test no invalid rows file is created when every code is valid."""
+    input_file = output_dir / "icd10_apcs.csv"
+    input_file.write_text(APCS_HEADER + "2024-25,A00,10,20,30\n")
+
+    _, _, _, _, _, invalid_files = vo.process_source(str(input_file), "apcs")
+
+    assert invalid_files == []
+    assert not (output_dir / "icd10_apcs_invalid_rows.csv").exists()
+
+
+def test_plain_csv_writer_matches_csv_writer(tmp_path):
+    """Test PlainCsvWriter writes exactly what csv.writer would."""
+    rows = [
+        ["A00", "10", "<15"],
+        ["A00.X", "0", ""],
+        [" a00 ", "10", "20"],
+        ["A0,1", "10", "20"],
+        ['A"01', "10", "20"],
+        ["A01\n", "10", "20"],
+        ["A01\r", "10", "20"],
+        [""],
+        ["", ""],
+        [],
+    ]
+    expected, actual = tmp_path / "expected.csv", tmp_path / "actual.csv"
+    with open(expected, "w", newline="") as f:
+        csv.writer(f).writerows(rows)
+    with open(actual, "w", newline="") as f:
+        vo.PlainCsvWriter(f).writerows(rows)
+
+    assert actual.read_bytes() == expected.read_bytes()
+
+
+def test_write_partitioned_csv(output_dir):
+    """Test large outputs are split into files under the 5,000 row limit."""
+    rows = [[f"A{i:04d}", "10"] for i in range(10000)]
+
+    created = vo.write_partitioned_csv(["icd10_code", "count"], "big", rows)
+
+    assert created == [
+        ("output/big_rows_0001_4991.csv", 4990),
+        ("output/big_rows_4992_9982.csv", 4990),
+        ("output/big_rows_9983_10003.csv", 20),
+    ]
+    last = read_rows(output_dir / "big_rows_9983_10003.csv")
+    assert last[0] == ["icd10_code", "count"]
+    assert last[-1] == ["A9999", "10"]
+    # Partitions are renamed once complete, leaving no temporary files behind
+    assert sorted(p.name for p in output_dir.iterdir()) == [
+        "big_rows_0001_4991.csv",
+        "big_rows_4992_9982.csv",
+        "big_rows_9983_10003.csv",
+    ]
+
+
+def test_write_partitioned_csv_single_file(output_dir):
+    """Test outputs just under the limit are written to a single file."""
+    rows = [[f"A{i:04d}", "10"] for i in range(4998)]
+
+    created = vo.write_partitioned_csv(["icd10_code", "count"], "small", rows)
+
+    assert created == [("output/small.csv", 4998)]
+    assert len(read_rows(output_dir / "small.csv")) == 4999
+
+
+def test_write_partitioned_csv_at_threshold(output_dir):
+    """Test the first row over the limit moves the output into partitions."""
+    rows = [[f"A{i:04d}", "10"] for i in range(4999)]
+
+    created = vo.write_partitioned_csv(["icd10_code", "count"], "edge", rows)
+
+    assert created == [
+        ("output/edge_rows_0001_4991.csv", 4990),
+        ("output/edge_rows_4992_5001.csv", 9),
+    ]
+    assert not (output_dir / "edge.csv").exists()
+    first = read_rows(output_dir / "edge_rows_0001_4991.csv")
+    second = read_rows(output_dir / "edge_rows_4992_5001.csv")
+    assert first[-1] == ["A4989", "10"]
+    assert second[0] == ["icd10_code", "count"]
+    assert second[1:] == rows[4990:]
+
+
+def test_write_partitioned_csv_no_rows(output_dir):
+    """Test a header-only file is written when there are no rows."""
+    created = vo.write_partitioned_csv(["icd10_code", "count"], "empty", [])
+
+    assert created == [("output/empty.csv", 0)]
+    assert read_rows(output_dir / "empty.csv") == [["icd10_code", "count"]]
+
+
+def test_process_source_partitions_large_financial_year(output_dir):
+    """Test per-FY outputs are partitioned while streaming the input."""
+    input_file = output_dir / "icd10_apcs.csv"
+    input_file.write_text(
+        APCS_HEADER
+        + "".join(f"2024-25,A{i:03d},10,10,10\n" for i in range(6000))
+        + "2023-24,B99,10,10,10\n"
+    )
+
+    _, _, row_count, _, fy_files, _ = vo.process_source(str(input_file), "apcs")
+
+    assert row_count == 6001
+    assert sorted(fy_files) == [
+        ("output/icd10_apcs_2023_24.csv", 1),
+        ("output/icd10_apcs_2024_25_rows_0001_4991.csv", 4990),
+        ("output/icd10_apcs_2024_25_rows_4992_6002.csv", 1010),
+    ]
+
+
+def test_main_writes_report(output_dir):
+    """Test main() validates both sources and writes the report."""
+    (output_dir / "icd10_apcs.csv").write_text(
+        APCS_HEADER + "2024-25,A00,10,20,30\n2024/25,XYZ,10,20,30\n"
+    )
+    (output_dir / "icd10_ons_deaths.csv").write_text(
+        "financial_year,icd10_code,primary_cause_count,contributing_cause_count\n"
+        "2023-24,B99,10,20\n"
+    )
+
+    vo.main()
+
+    report = (output_dir / "validation_report.txt").read_text()
+    assert "ICD10 CODE OUTPUT VALIDATION REPORT" in report
+    assert "  Rows: 2" in report
+    assert "  Rows: 1" in report
+    assert "    - 2024/25" in report
+    assert "output/icd10_apcs_2024_25.csv: 1 rows" in report
+    assert "output/icd10_apcs_invalid_rows.csv" in report
+    assert "output/icd10_ons_deaths_2023_24.csv: 1 rows" in report